@@ -3,6 +3,7 @@ import tempfile
 import pytest
 from mixer.backend.django import mixer as _mixer
 from posts.models import Post, Group
+from posts.synthetic import Generator
 
 
 @pytest.fixture()
@@ -12,6 +13,12 @@ def mock_media(settings):
         yield temp_directory
 
 
+@pytest.fixture(autouse=True)
+def inline_image_processing(settings):
+    """Картинки обрабатываются в потоке теста, а не в фоновом пуле."""
+    settings.IMAGE_WORKERS = 0
+
+
 @pytest.fixture
 def mixer():
     return _mixer
@@ -45,3 +52,10 @@ def few_posts_with_group(mixer, user, group):
 def another_few_posts_with_group_with_follower(mixer, user, another_user, group):
     mixer.blend('posts.Follow', user=user, author=another_user)
     mixer.cycle(20).blend(Post, author=another_user, group=group)
+
+
+@pytest.fixture
+def synthetic_data(db):
+    """Набор данных побольше: популярные и редкие авторы, подписки,
+    комментарии. Тот же seed - те же данные в каждом прогоне."""
+    Generator(seed=1).generate(users=50, groups=5, posts=500, comments=500, follows=5)
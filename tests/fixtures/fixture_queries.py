@@ -0,0 +1,29 @@
+from contextlib import contextmanager
+
+import pytest
+from core.queries import QueryStats
+
+
+@pytest.fixture
+def query_budget(settings):
+    """Проверяет, что представление укладывается в свой бюджет запросов.
+
+    Бюджеты объявлены в `settings.QUERY_BUDGETS` по имени URL:
+
+        with query_budget('posts:index'):
+            client.get('/')
+    """
+    @contextmanager
+    def check(view_name):
+        budget = settings.QUERY_BUDGETS.get(view_name)
+        assert budget is not None, (
+            f'Объявите бюджет запросов для `{view_name}` '
+            'в `settings.QUERY_BUDGETS`'
+        )
+        with QueryStats() as stats:
+            yield stats
+        assert stats.count <= budget, (
+            f'Представление `{view_name}` выполнило {stats.count} '
+            f'SQL-запросов при бюджете {budget}'
+        )
+    return check
@@ -0,0 +1,71 @@
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Post, User
+from posts.urls import app_name, urlpatterns
+
+COMMENTS_CNT = 5
+
+
+@pytest.fixture
+def budget_data(mixer, user, another_user, group):
+    post = Post.objects.create(text='Пост автора', author=another_user, group=group)
+    Post.objects.create(text='Свой пост', author=user, group=group)
+    Follow.objects.create(user=user, author=another_user)
+    for i in range(COMMENTS_CNT):
+        commentator = mixer.blend('auth.User')
+        Comment.objects.create(text=f'Комментарий {i}', author=commentator, post=post)
+    return post
+
+
+def view_requests(post, user):
+    """Как обратиться к каждому маршруту `posts.urls`."""
+    author = post.author.username
+    return {
+        'index': ('get', reverse('posts:index'), None),
+        'group_list': ('get', reverse('posts:group_list', args=[post.group.slug]), None),
+        'profile': ('get', reverse('posts:profile', args=[author]), None),
+        'post_detail': ('get', reverse('posts:post_detail', args=[post.pk]), None),
+        'search': ('get', reverse('posts:search'), {'q': 'пост', 'group': post.group.slug}),
+        'group_autocomplete': ('get', reverse('posts:group_autocomplete'), {'term': 'Тест'}),
+        'post_create': ('post', reverse('posts:post_create'), {'text': 'Новый пост', 'group': post.group_id}),
+        'post_edit': ('get', reverse('posts:post_edit', args=[user.posts.first().pk]), None),
+        'add_comment': ('post', reverse('posts:add_comment', args=[post.pk]), {'text': 'Ещё комментарий'}),
+        'follow_index': ('get', reverse('posts:follow_index'), None),
+        'profile_follow': ('get', reverse('posts:profile_follow', args=[author]), None),
+        'profile_unfollow': ('get', reverse('posts:profile_unfollow', args=[author]), None),
+    }
+
+
+class TestQueryBudget:
+
+    @pytest.mark.django_db
+    def test_every_view_has_request(self, budget_data, user):
+        names = {pattern.name for pattern in urlpatterns}
+        assert names == set(view_requests(budget_data, user)), (
+            'Добавьте новый маршрут `posts.urls` в проверку бюджета запросов'
+        )
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('name', [pattern.name for pattern in urlpatterns])
+    def test_view_query_budget(self, name, budget_data, user, user_client, query_budget):
+        cache.clear()
+        method, url, data = view_requests(budget_data, user)[name]
+        with query_budget(f'{app_name}:{name}'):
+            response = getattr(user_client, method)(url, data=data)
+        assert response.status_code in (200, 302)
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('name', ['index', 'group_list', 'profile', 'post_detail', 'search', 'follow_index'])
+    def test_view_query_budget_at_scale(self, name, synthetic_data, client, query_budget):
+        """Бюджет не зависит от объёма данных: самый популярный автор,
+        самый обсуждаемый пост и самый активный читатель."""
+        cache.clear()
+        post = Post.objects.exclude(group=None).order_by('-comments_count').first()
+        reader = User.objects.order_by('-stats__following_count').first()
+        client.force_login(reader)
+        method, url, data = view_requests(post, reader)[name]
+        with query_budget(f'{app_name}:{name}'):
+            response = getattr(client, method)(url, data=data)
+        assert response.status_code == 200
@@ -0,0 +1,137 @@
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .stampede import LOCK_SUFFIX
+
+GENERATION_KEY = 'two-tier:generation'
+
+
+class TwoTierCache(BaseCache):
+    """Локальный кеш процесса (L1) перед общим кешем воркеров (L2).
+
+    Все записи идут в L2, поэтому он остаётся источником истины. L1
+    держит прочитанные значения не дольше `L1_TIMEOUT` секунд, а ключи с
+    префиксами из `L2_ONLY_PREFIXES` (версии, счётчики) и блокировки
+    `core.stampede` читаются только из L2 - так инвалидация через версии
+    и снятие блокировки сразу видны всем процессам. Ключи с префиксами из
+    `PERSISTENT_PREFIXES` не истекают и после `incr()`.
+    `clear()` меняет поколение в L2, и остальные процессы сбрасывают свой
+    L1 не позже чем через `SYNC_INTERVAL` секунд.
+
+        'default': {
+            'BACKEND': 'core.cache_backends.TwoTierCache',
+            'OPTIONS': {'L1': 'local', 'L2': 'shared'},
+        }
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l1_alias = options.get('L1', 'local')
+        self._l2_alias = options.get('L2', 'shared')
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        self.sync_interval = options.get('SYNC_INTERVAL', 1)
+        self.l2_only = tuple(options.get('L2_ONLY_PREFIXES', ()))
+        self.persistent = tuple(options.get('PERSISTENT_PREFIXES', ()))
+        self._generation = None
+        self._synced_at = 0.0
+
+    @property
+    def l1(self):
+        return caches[self._l1_alias]
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _local(self, key):
+        return not (key.startswith(self.l2_only)
+                    or key.endswith(LOCK_SUFFIX))
+
+    def _l1_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = now
+        generation = self.l2.get(GENERATION_KEY)
+        if generation != self._generation:
+            self.l1.clear()
+            self._generation = generation
+
+    def get(self, key, default=None, version=None):
+        if self._local(key):
+            self._sync()
+            value = self.l1.get(key, self, version=version)
+            if value is not self:
+                return value
+        value = self.l2.get(key, self, version=version)
+        if value is self:
+            return default
+        if self._local(key):
+            self.l1.set(key, value, self.l1_timeout, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        local = [key for key in keys if self._local(key)]
+        found = self.l1.get_many(local, version=version)
+        missing = [key for key in keys if key not in found]
+        fetched = self.l2.get_many(missing, version=version)
+        self.l1.set_many(
+            {key: value for key, value in fetched.items()
+             if self._local(key)},
+            self.l1_timeout, version=version,
+        )
+        found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        if self._local(key):
+            self.l1.set(key, value, self._l1_timeout(timeout),
+                        version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version=version)
+        if added and self._local(key):
+            self.l1.set(key, value, self._l1_timeout(timeout),
+                        version=version)
+        return added
+
+    def delete(self, key, version=None):
+        self.l2.delete(key, version=version)
+        self.l1.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        self.l2.delete_many(keys, version=version)
+        self.l1.delete_many(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.l1.delete(key, version=version)
+        value = self.l2.incr(key, delta, version=version)
+        if (key.startswith(self.persistent)
+                and type(self.l2).incr is BaseCache.incr):
+            # Неатомарный BaseCache.incr (db, filebased) пересохраняет
+            # ключ с таймаутом по умолчанию, и версия истекла бы
+            self.l2.set(key, value, None, version=version)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version=version)
+
+    def clear(self):
+        self.l2.clear()
+        self.l2.set(GENERATION_KEY, time.time_ns(), None)
+        self.l1.clear()
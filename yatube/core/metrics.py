@@ -0,0 +1,304 @@
+"""Метрики приложения в текстовом формате Prometheus.
+
+Счётчики, gauge и гистограммы живут в памяти процесса, каждое
+изменение - словарь под своей блокировкой. Чтобы `/metrics` показывал
+сумму по всем воркерам, каждый процесс не чаще раза в
+`METRICS_FLUSH_INTERVAL` секунд пишет снимок в `METRICS_DIR/<pid>.json`,
+а `collect()` складывает снимки. Счётчики и гистограммы завершившихся
+воркеров переносятся в `retired.json`, а их файлы удаляются, так что
+суммы не уменьшаются и каталог не растёт. Gauge снимаются в момент
+запроса, поэтому по файлам не складываются: `/metrics` показывает их
+для ответившего процесса. Без `METRICS_DIR` видны только метрики
+текущего процесса.
+
+    REQUESTS = Counter('app_requests_total', 'Запросы', ['view'])
+    REQUESTS.inc(view='posts:index')
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RETIRED = 'retired.json'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+        self._flushed_at = 0.0
+        self._pid = None
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self.metrics:
+                raise ValueError(f'Метрика {metric.name} уже объявлена')
+            self.metrics[metric.name] = metric
+
+    def snapshot(self):
+        return {name: metric.snapshot()
+                for name, metric in self.metrics.items()}
+
+    def flush(self, force=False):
+        """Пишет снимок процесса в `METRICS_DIR`, если пора."""
+        directory = settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or (
+                not force
+                and now - self._flushed_at < settings.METRICS_FLUSH_INTERVAL):
+            return
+        self._flushed_at = now
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        if self._pid != os.getpid():
+            # Файл с нашим pid остался от завершившегося воркера
+            self._pid = os.getpid()
+            _retire(directory, path)
+        _write(path, self.snapshot())
+
+    def collect(self):
+        """Снимки всех процессов, сложенные по метрикам и меткам."""
+        if not settings.METRICS_DIR:
+            return self.snapshot()
+        self.flush(force=True)
+        directory = settings.METRICS_DIR
+        own = f'{os.getpid()}.json'
+        filenames = []
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.json'):
+                continue
+            if filename == RETIRED or _alive(filename):
+                filenames.append(filename)
+            else:
+                _retire(directory, os.path.join(directory, filename))
+                filenames.append(RETIRED)
+        merged = {}
+        for filename in sorted(set(filenames)):
+            if filename == own:
+                snapshot = self.snapshot()
+            else:
+                snapshot = _read(os.path.join(directory, filename))
+            for name, data in snapshot.items():
+                if data['type'] != 'gauge' or filename == own:
+                    _merge(merged, name, data)
+        return merged
+
+
+def _alive(filename):
+    try:
+        pid = int(filename[:-len('.json')])
+    except ValueError:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(path, data):
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as stream:
+        json.dump(data, stream)
+    os.replace(temporary, path)
+
+
+def _retire(directory, path):
+    """Переносит счётчики и гистограммы снимка в `RETIRED` и удаляет его.
+
+    Снимок сначала переименовывается: если два воркера увидели один
+    файл, перенесёт его только тот, у кого получилось."""
+    claimed = f'{path}.{os.getpid()}.retiring'
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        return
+    retired = os.path.join(directory, RETIRED)
+    with open(f'{retired}.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        merged = {}
+        for snapshot in (_read(retired), _read(claimed)):
+            for name, data in snapshot.items():
+                if data['type'] != 'gauge':
+                    _merge(merged, name, data)
+        _write(retired, merged)
+    os.remove(claimed)
+
+
+def _merge(merged, name, data):
+    target = merged.setdefault(name, dict(data, samples=[]))
+    samples = {tuple(labels): value for labels, value in target['samples']}
+    for labels, value in data['samples']:
+        labels = tuple(labels)
+        if labels not in samples:
+            samples[labels] = value
+        elif isinstance(value, list):
+            samples[labels] = [a + b for a, b in zip(samples[labels], value)]
+        else:
+            samples[labels] += value
+    target['samples'] = [[list(labels), value]
+                         for labels, value in samples.items()]
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(),
+                 registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            samples = [[list(key), self._copy(value)]
+                       for key, value in self._values.items()]
+        return {
+            'type': self.type,
+            'help': self.documentation,
+            'labels': list(self.labelnames),
+            'samples': samples,
+        }
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """Значение - счётчики корзин `buckets`, затем сумма и число."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def _copy(self, value):
+        return list(value)
+
+    def snapshot(self):
+        return dict(super().snapshot(), buckets=list(self.buckets))
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"')
+         .replace('\n', r'\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def exposition(collected):
+    """Текст для Prometheus (формат 0.0.4) из `collect()`."""
+    lines = []
+    for name in sorted(collected):
+        data = collected[name]
+        lines.append(f'# HELP {name} {data["help"]}')
+        lines.append(f'# TYPE {name} {data["type"]}')
+        for values, value in sorted(data['samples']):
+            if data['type'] != 'histogram':
+                lines.append(
+                    f'{name}{_labels(data["labels"], values)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(data['buckets'], value):
+                cumulative += count
+                label = _labels(data['labels'], values, [('le', bound)])
+                lines.append(f'{name}_bucket{label} {cumulative}')
+            label = _labels(data['labels'], values, [('le', '+Inf')])
+            lines.append(f'{name}_bucket{label} {value[-1]}')
+            plain = _labels(data['labels'], values)
+            lines.append(f'{name}_sum{plain} {value[-2]}')
+            lines.append(f'{name}_count{plain} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight',
+    'Запросы, которые сейчас обрабатывает ответивший воркер')
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Время ответа по представлениям',
+    ['view', 'method'])
+REQUESTS = Counter(
+    'http_requests_total', 'Ответы по представлениям и статусам',
+    ['view', 'method', 'status'])
+DB_QUERIES = Counter(
+    'db_queries_total', 'SQL-запросы по представлениям', ['view'])
+DB_SECONDS = Counter(
+    'db_query_seconds_total', 'Время в базе по представлениям', ['view'])
+TEMPLATE_RENDERS = Counter(
+    'template_renders_total', 'Рендеры шаблонов', ['template'])
+TEMPLATE_SECONDS = Counter(
+    'template_render_seconds_total',
+    'Собственное время рендеринга шаблонов', ['template'])
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total',
+    'Обращения к кешу core.stampede: hit - свежее значение, stale - '
+    'устаревшее, пока другой воркер пересчитывает, wait - дождались '
+    'чужого пересчёта, miss - пересчёт',
+    ['cache', 'result'])
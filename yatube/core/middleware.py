@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+
+from . import metrics
+from .queries import QueryStats
+
+
+class QueryStatsMiddleware:
+    """Замеряет число SQL-запросов и время в БД на каждый запрос.
+
+    Результат доступен в `request.query_stats`, а при
+    `QUERY_STATS_HEADERS` ещё и в заголовках ответа `X-DB-Query-Count`
+    и `X-DB-Time-Ms`."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryStats() as stats:
+            request.query_stats = stats
+            response = self.get_response(request)
+        if settings.QUERY_STATS_HEADERS:
+            response['X-DB-Query-Count'] = stats.count
+            response['X-DB-Time-Ms'] = f'{stats.duration * 1000:.2f}'
+        return response
+
+
+class MetricsMiddleware:
+    """Считает метрики запросов для `/metrics` (см. `core.metrics`).
+
+    Ставится перед `QueryStatsMiddleware` и `TemplateTimingMiddleware`,
+    чтобы взять их замеры из `request.query_stats` и
+    `request.template_timings`. Метка `view` - имя маршрута, а не путь,
+    чтобы число рядов не росло с числом постов и пользователей."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.REQUESTS_IN_FLIGHT.dec()
+        self.record(request, response, time.perf_counter() - started)
+        metrics.REGISTRY.flush()
+        return response
+
+    def record(self, request, response, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.REQUEST_DURATION.observe(
+            elapsed, view=view, method=request.method)
+        metrics.REQUESTS.inc(
+            view=view, method=request.method, status=response.status_code)
+        stats = getattr(request, 'query_stats', None)
+        if stats is not None:
+            metrics.DB_QUERIES.inc(stats.count, view=view)
+            metrics.DB_SECONDS.inc(stats.duration, view=view)
+        timings = getattr(request, 'template_timings', None)
+        if timings is not None:
+            for name, (count, spent) in timings.totals.items():
+                metrics.TEMPLATE_RENDERS.inc(count, template=name)
+                metrics.TEMPLATE_SECONDS.inc(spent, template=name)
@@ -0,0 +1,152 @@
+"""Выборочное профилирование запросов.
+
+`ProfilingMiddleware` профилирует долю `PROFILING_SAMPLE_RATE` случайных
+запросов и запросы с подписанным заголовком `PROFILING_HEADER`
+(значение даёт `make_token()`). Во время такого запроса отдельный поток
+раз в `PROFILING_INTERVAL` секунд снимает стек потока запроса. Стеки
+пишутся в `PROFILING_DIR` в формате collapsed stacks для flamegraph.pl
+или speedscope. Корень каждого стека - `db`, `template` или `python`,
+так что время сразу видно разделённым на базу, шаблоны и остальной код.
+Если оба способа выключены, middleware убирает себя из цепочки.
+"""
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+SALT = 'core.profiling'
+CATEGORIES = (
+    ('db', 'django.db.backends'),
+    ('template', 'django.template'),
+)
+
+
+def make_token():
+    """Значение заголовка `PROFILING_HEADER` для профиля по запросу."""
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def valid_token(value):
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(
+            value, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def collapse(frame, stop=None):
+    """Стек от корня к `frame` как `категория;модуль:функция;...`.
+
+    Кадры выше `stop` (сервер, внешние middleware) отбрасываются."""
+    names = []
+    category = 'python'
+    while frame is not None and frame.f_code is not stop:
+        module = frame.f_globals.get('__name__', '?')
+        names.append(f'{module}:{frame.f_code.co_name}')
+        for name, prefix in CATEGORIES:
+            if module.startswith(prefix) and category == 'python':
+                category = name
+        frame = frame.f_back
+    names.append(category)
+    return ';'.join(reversed(names)), category
+
+
+class StackSampler:
+    """Поток, который снимает стек другого потока через равные промежутки."""
+
+    def __init__(self, thread_id, interval, stop=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stop_code = stop
+        self.stacks = Counter()
+        self.categories = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='profiling-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack, category = collapse(frame, self.stop_code)
+            self.stacks[stack] += 1
+            self.categories[category] += 1
+
+
+class ProfilingMiddleware:
+    """Снимает профиль выбранных запросов, см. описание модуля.
+
+    Ставится первым в `MIDDLEWARE`, чтобы видеть все остальные."""
+
+    def __init__(self, get_response):
+        if not (settings.PROFILING_SAMPLE_RATE
+                or settings.PROFILING_HEADER):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.header = 'HTTP_' + settings.PROFILING_HEADER.upper().replace(
+            '-', '_')
+
+    def __call__(self, request):
+        requested = self.requested(request)
+        if (not requested
+                and random.random() >= settings.PROFILING_SAMPLE_RATE):
+            return self.get_response(request)
+        sampler = StackSampler(
+            threading.get_ident(), settings.PROFILING_INTERVAL,
+            stop=sys._getframe().f_code)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        summary = self.save(request, sampler, time.perf_counter() - started)
+        if requested:
+            response['X-Profile'] = summary
+        return response
+
+    def requested(self, request):
+        value = settings.PROFILING_HEADER and request.META.get(self.header)
+        return bool(value) and valid_token(value)
+
+    def save(self, request, sampler, elapsed):
+        """Пишет стеки в файл и возвращает сводку по категориям.
+
+        Время категории - её доля снятых стеков от времени запроса."""
+        total = sum(sampler.categories.values())
+        if not total:
+            return f'-; total={elapsed * 1000:.1f}ms; no samples'
+        match = request.resolver_match
+        view = (match.view_name if match else 'unresolved').replace(':', '-')
+        name = (f'{time.strftime("%Y%m%d-%H%M%S")}-{view}-'
+                f'{uuid.uuid4().hex[:8]}.collapsed')
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        with open(os.path.join(settings.PROFILING_DIR, name), 'w',
+                  encoding='utf-8') as stream:
+            for stack, count in sampler.stacks.most_common():
+                stream.write(f'{stack} {count}\n')
+        split = '; '.join(
+            f'{category}={elapsed * count / total * 1000:.1f}ms'
+            for category, count in sorted(sampler.categories.items()))
+        summary = f'{name}; total={elapsed * 1000:.1f}ms; {split}'
+        logger.info('Профиль %s: %s', request.path, summary)
+        return summary
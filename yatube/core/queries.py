@@ -0,0 +1,37 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+
+class QueryStats:
+    """Считает SQL-запросы и их суммарное время во всех подключениях.
+
+    Использование:
+        with QueryStats() as stats:
+            ...
+        stats.count, stats.duration
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+        self._stack = None
@@ -0,0 +1,90 @@
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import CACHE_LOOKUPS
+
+LOCK_SUFFIX = ':lock'
+WAIT_STEP = 0.05
+
+
+class Entry:
+    """Значение в кеше вместе с мягким сроком жизни и ценой пересчёта."""
+
+    def __init__(self, value, expires_at, delta):
+        self.value = value
+        self.expires_at = expires_at
+        self.delta = delta
+
+    def should_refresh(self, beta):
+        # Вероятностное раннее истечение (XFetch): чем дороже пересчёт
+        # и ближе срок, тем вероятнее обновить значение заранее.
+        jitter = self.delta * beta * -math.log(1.0 - random.random())
+        return time.time() + jitter >= self.expires_at
+
+
+def get_or_compute(key, compute, timeout, is_valid=None, name='other',
+                   entry=None):
+    """Возвращает значение из кеша, пересчитывая его одним воркером.
+
+    Пока один процесс держит блокировку и пересчитывает значение,
+    остальные получают устаревшее (истёкшее или не прошедшее `is_valid`).
+    Если устаревшего нет, они ждут результат, но не дольше блокировки;
+    если держатель снял блокировку, ничего не сохранив (`compute` упал),
+    ожидание прерывается и значение пересчитывается под новой блокировкой.
+    Исход обращения считается в `cache_lookups_total` с меткой `name`.
+    `entry` - уже прочитанная запись (например, одним `get_many` на всю
+    страницу); без неё запись читается из кеша.
+    """
+    if entry is None:
+        entry = cache.get(key)
+    stale = entry
+    if entry is not None:
+        fresh = is_valid is None or is_valid(entry.value)
+        if fresh and not entry.should_refresh(
+                settings.CACHE_EARLY_EXPIRATION_BETA):
+            CACHE_LOOKUPS.inc(cache=name, result='hit')
+            return entry.value
+
+    lock_key = key + LOCK_SUFFIX
+    locked = cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT)
+    if not locked:
+        if stale is not None:
+            CACHE_LOOKUPS.inc(cache=name, result='stale')
+            return stale.value
+        entry = _wait_for(key)
+        if entry is not None:
+            CACHE_LOOKUPS.inc(cache=name, result='wait')
+            return entry.value
+        locked = cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT)
+    CACHE_LOOKUPS.inc(cache=name, result='miss')
+    try:
+        started = time.time()
+        value = compute()
+        delta = time.time() - started
+        if timeout is None:
+            entry = Entry(value, math.inf, delta)
+        else:
+            entry = Entry(value, time.time() + timeout, delta)
+            timeout += settings.CACHE_STALE_GRACE
+        cache.set(key, entry, timeout)
+        return value
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def _wait_for(key):
+    """Ждёт значение, пока держатель блокировки не снимет её."""
+    deadline = time.time() + settings.CACHE_LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if cache.get(key + LOCK_SUFFIX) is None:
+            return cache.get(key)
+    return None
@@ -0,0 +1,69 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from core.stampede import get_or_compute
+
+register = template.Library()
+
+VERSION_ARG = 'version='
+
+
+class StampedeCacheNode(template.Node):
+    def __init__(self, nodelist, expire_time, fragment_name, vary_on,
+                 version):
+        self.nodelist = nodelist
+        self.expire_time = expire_time
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.version = version
+
+    def render(self, context):
+        expire_time = self.expire_time.resolve(context)
+        if expire_time is not None:
+            try:
+                expire_time = int(expire_time)
+            except (ValueError, TypeError):
+                raise template.TemplateSyntaxError(
+                    f'"stampede_cache" tag got a non-integer timeout '
+                    f'value: {expire_time!r}')
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        version = self.version.resolve(context) if self.version else None
+        key = 'stampede.' + make_template_fragment_key(
+            self.fragment_name, vary_on)
+        _, content = get_or_compute(
+            key,
+            lambda: (version, self.nodelist.render(context)),
+            expire_time,
+            is_valid=lambda value: value[0] == version,
+            name=self.fragment_name,
+        )
+        return content
+
+
+@register.tag('stampede_cache')
+def do_stampede_cache(parser, token):
+    """Как `{% cache %}`, но с защитой от одновременного пересчёта.
+
+        {% stampede_cache 600 index_page page_obj.number version=ver %}
+            ...
+        {% endstampede_cache %}
+
+    Смена `version` не создаёт новый ключ: пока один воркер рендерит
+    фрагмент заново, остальные получают предыдущую версию.
+    """
+    nodelist = parser.parse(('endstampede_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    version = None
+    if tokens[-1].startswith(VERSION_ARG):
+        version = parser.compile_filter(tokens.pop()[len(VERSION_ARG):])
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{tokens[0]}' tag requires at least 2 arguments.")
+    return StampedeCacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [parser.compile_filter(token) for token in tokens[3:]],
+        version,
+    )
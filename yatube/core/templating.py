@@ -0,0 +1,160 @@
+"""Время рендеринга шаблонов и прогрев кеша скомпилированных шаблонов.
+
+`install()` оборачивает `Template.render` (страница и `{% include %}`),
+`ExtendsNode.render` (родитель из `{% extends %}`) и `BlockNode.render`
+(блок - шаблону, который его переопределил). Пока идёт запрос,
+`TemplateTimingMiddleware` копит собственное время каждого шаблона, без
+вложенных, так что сумма равна всему рендерингу. Замеры уходят в метрики
+(`core.middleware.MetricsMiddleware`), а при `TEMPLATE_TIMING` - ещё и в
+заголовок `Server-Timing`, который видно во вкладке Network браузера.
+"""
+import contextvars
+import logging
+import os
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.template import (TemplateDoesNotExist, TemplateSyntaxError,
+                             engines)
+from django.template.base import Template
+from django.template.loader_tags import (BLOCK_CONTEXT_KEY, BlockNode,
+                                         ExtendsNode)
+from django.template.loaders.cached import Loader as CachedLoader
+
+logger = logging.getLogger(__name__)
+
+# Какие файлы из каталогов шаблонов компилировать заранее
+SUFFIXES = ('.html', '.txt')
+
+_timings = contextvars.ContextVar('template_timings', default=None)
+
+
+class TemplateTimings:
+    """Собственное время и число рендеров каждого шаблона за запрос."""
+
+    def __init__(self):
+        self.totals = {}
+        self._nested = []
+
+    def enter(self):
+        self._nested.append(0.0)
+
+    def exit(self, name, elapsed):
+        nested = self._nested.pop()
+        count, spent = self.totals.get(name, (0, 0.0))
+        self.totals[name] = (count + 1, spent + elapsed - nested)
+        if self._nested:
+            self._nested[-1] += elapsed
+
+    def header(self):
+        """Значение `Server-Timing`: общее время и шаблоны по убыванию."""
+        entries = sorted(
+            self.totals.items(), key=lambda item: item[1][1], reverse=True)
+        total = sum(spent for _, spent in self.totals.values())
+        parts = [f'tpl;dur={total * 1000:.3f};desc="templates"']
+        for name, (count, spent) in entries:
+            token = re.sub(r'[^\w.-]', '.', name)
+            parts.append(
+                f'tpl.{token};dur={spent * 1000:.3f};desc="{name} x{count}"')
+        return ', '.join(parts)
+
+
+def _timed(render, name_of):
+    @wraps(render)
+    def wrapper(self, context):
+        timings = _timings.get()
+        if timings is None:
+            return render(self, context)
+        timings.enter()
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            timings.exit(
+                name_of(self, context), time.perf_counter() - started)
+    wrapper.timed = True
+    return wrapper
+
+
+def _template_name(template, context):
+    return template.name or '<string>'
+
+
+def _parent_name(node, context):
+    parent = node.parent_name.resolve(context)
+    return getattr(parent, 'name', parent) or '<string>'
+
+
+def _block_name(node, context):
+    # Отрендерится последний переопределивший блок шаблон
+    block_context = context.render_context.get(BLOCK_CONTEXT_KEY)
+    block = block_context and block_context.get_block(node.name) or node
+    origin = getattr(block, 'origin', None)
+    return origin.template_name if origin else '<string>'
+
+
+def install():
+    """Включает замер; повторный вызов ничего не делает."""
+    for cls, name_of in ((Template, _template_name),
+                         (ExtendsNode, _parent_name),
+                         (BlockNode, _block_name)):
+        if not getattr(cls.render, 'timed', False):
+            cls.render = _timed(cls.render, name_of)
+
+
+class TemplateTimingMiddleware:
+    """Кладёт замеры в `request.template_timings`, а при `TEMPLATE_TIMING`
+    добавляет к ответу `Server-Timing` со временем шаблонов."""
+
+    def __init__(self, get_response):
+        install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = TemplateTimings()
+        token = _timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        request.template_timings = timings
+        if settings.TEMPLATE_TIMING and timings.totals:
+            response['Server-Timing'] = timings.header()
+        return response
+
+
+def template_names(loader):
+    """Имена всех шаблонов в каталогах загрузчика."""
+    get_dirs = getattr(loader, 'get_dirs', lambda: ())
+    for directory in get_dirs():
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                if filename.endswith(SUFFIXES):
+                    path = os.path.relpath(
+                        os.path.join(root, filename), directory)
+                    yield path.replace(os.sep, '/')
+
+
+def precompile():
+    """Компилирует все шаблоны в кеш `cached.Loader`, чтобы первые
+    запросы воркера не разбирали их сами. Без кеширующего загрузчика
+    ничего не делает. Возвращает число скомпилированных шаблонов."""
+    compiled = 0
+    for backend in engines.all():
+        engine = getattr(backend, 'engine', None)
+        for loader in getattr(engine, 'template_loaders', ()):
+            if not isinstance(loader, CachedLoader):
+                continue
+            for inner in loader.loaders:
+                for name in template_names(inner):
+                    try:
+                        loader.get_template(name)
+                    except (TemplateSyntaxError, TemplateDoesNotExist,
+                            UnicodeDecodeError) as error:
+                        logger.warning('Шаблон %s не скомпилирован: %s',
+                                       name, error)
+                    else:
+                        compiled += 1
+    return compiled
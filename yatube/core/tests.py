@@ -0,0 +1,424 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.template import Context, Template, engines
+from django.test import RequestFactory, TestCase, override_settings
+
+from . import metrics
+from .cache_backends import TwoTierCache
+from .profiling import ProfilingMiddleware, collapse, make_token
+from .templating import TemplateTimings, precompile
+from .stampede import LOCK_SUFFIX, get_or_compute
+
+LOCMEM = 'django.core.cache.backends.locmem.LocMemCache'
+FILEBASED = 'django.core.cache.backends.filebased.FileBasedCache'
+PROFILES_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+METRICS_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# Такого процесса нет: pid больше предела ядра
+DEAD_PID = 2 ** 22 + 1
+
+
+def fail():
+    raise AssertionError('Значение не должно пересчитываться')
+
+
+class StampedeCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_value_is_computed_once(self):
+        """Свежее значение берётся из кеша без пересчёта"""
+        self.assertEqual(get_or_compute('key', lambda: 1, 60), 1)
+        self.assertEqual(get_or_compute('key', fail, 60), 1)
+
+    def test_stale_value_served_while_locked(self):
+        """Пока другой воркер пересчитывает, отдаётся устаревшее значение"""
+        get_or_compute('key', lambda: 'old', 60)
+        cache.add('key' + LOCK_SUFFIX, 1)
+        value = get_or_compute(
+            'key', fail, 60, is_valid=lambda value: value == 'new')
+        self.assertEqual(value, 'old')
+
+        cache.delete('key' + LOCK_SUFFIX)
+        value = get_or_compute(
+            'key', lambda: 'new', 60, is_valid=lambda value: value == 'new')
+        self.assertEqual(value, 'new')
+        self.assertIsNone(cache.get('key' + LOCK_SUFFIX))
+
+    def test_failed_holder_does_not_block_waiters(self):
+        """Если держатель блокировки упал, ожидание прерывается сразу"""
+        lock_key = 'key' + LOCK_SUFFIX
+        cache.add(lock_key, 1)
+        timer = threading.Timer(0.1, cache.delete, [lock_key])
+        timer.start()
+        started = time.time()
+        try:
+            self.assertEqual(get_or_compute('key', lambda: 'new', 60), 'new')
+        finally:
+            timer.join()
+        self.assertLess(time.time() - started, 1)
+        self.assertIsNone(cache.get(lock_key))
+
+    def test_lookups_are_counted(self):
+        """Исход обращения считается в cache_lookups_total"""
+        def count(result):
+            return metrics.CACHE_LOOKUPS._values.get(('test', result), 0)
+
+        before = {result: count(result) for result in ('hit', 'miss')}
+        get_or_compute('key', lambda: 1, 60, name='test')
+        get_or_compute('key', fail, 60, name='test')
+        self.assertEqual(count('miss'), before['miss'] + 1)
+        self.assertEqual(count('hit'), before['hit'] + 1)
+
+    def test_expired_value_is_recomputed(self):
+        """Истёкшее значение пересчитывается"""
+        get_or_compute('key', lambda: 'old', -1)
+        self.assertEqual(get_or_compute('key', lambda: 'new', 60), 'new')
+
+    def test_template_tag_renders_by_version(self):
+        """Тег stampede_cache кеширует фрагмент до смены версии"""
+        template = Template(
+            '{% load stampede %}'
+            '{% stampede_cache 60 fragment version=version %}'
+            '{{ text }}{% endstampede_cache %}'
+        )
+        render = template.render
+        self.assertEqual(render(Context({'text': 'a', 'version': 1})), 'a')
+        self.assertEqual(render(Context({'text': 'b', 'version': 1})), 'a')
+        self.assertEqual(render(Context({'text': 'b', 'version': 2})), 'b')
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': LOCMEM},
+    'l1_a': {'BACKEND': LOCMEM, 'LOCATION': 'a'},
+    'l1_b': {'BACKEND': LOCMEM, 'LOCATION': 'b'},
+    'shared': {'BACKEND': LOCMEM, 'LOCATION': 'shared'},
+    'file': {'BACKEND': FILEBASED,
+             'LOCATION': os.path.join(tempfile.gettempdir(), 'yatube-l2')},
+})
+class TwoTierCacheTest(TestCase):
+    def worker(self, l1, l2='shared'):
+        """Кеш одного воркера: свой L1 и общий L2."""
+        return TwoTierCache(None, {'OPTIONS': {
+            'L1': l1,
+            'L2': l2,
+            'SYNC_INTERVAL': 0,
+            'L2_ONLY_PREFIXES': ['version:'],
+            'PERSISTENT_PREFIXES': ['version:'],
+        }})
+
+    def test_writes_are_visible_to_other_workers(self):
+        """Запись одного воркера видна другому через общий L2"""
+        first, second = self.worker('l1_a'), self.worker('l1_b')
+        first.set('key', 'value', 60)
+        self.assertEqual(second.get('key'), 'value')
+        self.assertEqual(second.l1.get('key'), 'value')
+
+    def test_l2_only_keys_are_coherent(self):
+        """Версии читаются только из L2 и сразу видны всем воркерам"""
+        first, second = self.worker('l1_a'), self.worker('l1_b')
+        first.set('version:posts', 1, None)
+        self.assertEqual(second.get('version:posts'), 1)
+        first.incr('version:posts')
+        self.assertEqual(second.get('version:posts'), 2)
+        self.assertIsNone(second.l1.get('version:posts'))
+
+    def test_clear_flushes_other_workers_l1(self):
+        """clear() одного воркера сбрасывает L1 остальных"""
+        first, second = self.worker('l1_a'), self.worker('l1_b')
+        second.get('missing')
+        first.set('key', 'value', 60)
+        self.assertEqual(second.get('key'), 'value')
+        first.clear()
+        self.assertIsNone(second.get('key'))
+
+    def test_lock_release_is_seen_at_once(self):
+        """Блокировки core.stampede не оседают в L1"""
+        first, second = self.worker('l1_a'), self.worker('l1_b')
+        first.add('key' + LOCK_SUFFIX, 1, 10)
+        self.assertEqual(second.get('key' + LOCK_SUFFIX), 1)
+        first.delete('key' + LOCK_SUFFIX)
+        self.assertIsNone(second.get('key' + LOCK_SUFFIX))
+
+    def test_version_keys_survive_non_atomic_incr(self):
+        """После incr в filebased L2 версия не получает таймаут"""
+        worker = self.worker('l1_a', 'file')
+        worker.clear()
+        worker.set('version:posts', 1, None)
+        self.assertEqual(worker.incr('version:posts'), 2)
+        later = time.time() + worker.l2.default_timeout + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(worker.get('version:posts'), 2)
+        worker.clear()
+
+
+def slow_view(request):
+    time.sleep(0.03)
+    return HttpResponse('ok')
+
+
+@override_settings(PROFILING_DIR=PROFILES_DIR, PROFILING_SAMPLE_RATE=0.0,
+                   PROFILING_HEADER='X-Profile')
+class ProfilingMiddlewareTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(PROFILES_DIR, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(PROFILES_DIR, ignore_errors=True)
+        self.factory = RequestFactory()
+
+    def profiles(self):
+        if not os.path.isdir(PROFILES_DIR):
+            return []
+        return os.listdir(PROFILES_DIR)
+
+    @override_settings(PROFILING_HEADER='')
+    def test_disabled_middleware_is_not_used(self):
+        """Без доли и заголовка middleware убирает себя из цепочки"""
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(slow_view)
+
+    def test_signed_header_writes_collapsed_stacks(self):
+        """Запрос с подписанным заголовком профилируется"""
+        request = self.factory.get('/', HTTP_X_PROFILE=make_token())
+        response = ProfilingMiddleware(slow_view)(request)
+        self.assertIn('python=', response['X-Profile'])
+        [name] = self.profiles()
+        with open(os.path.join(PROFILES_DIR, name)) as stream:
+            lines = stream.read().splitlines()
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertTrue(stack.startswith('python;core.tests:slow_view'))
+        self.assertGreater(int(count), 0)
+
+    def test_forged_header_is_ignored(self):
+        """Заголовок без верной подписи ничего не включает"""
+        request = self.factory.get('/', HTTP_X_PROFILE='profile:forged')
+        response = ProfilingMiddleware(slow_view)(request)
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(self.profiles(), [])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_HEADER='')
+    def test_sampled_request_is_profiled_silently(self):
+        """Выбранный случайно запрос пишет профиль, но без заголовка"""
+        response = ProfilingMiddleware(slow_view)(self.factory.get('/'))
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(len(self.profiles()), 1)
+
+    def test_collapse_marks_category(self):
+        """Корень стека - категория по самому глубокому известному кадру"""
+        stack, category = collapse(sys._getframe(), stop=None)
+        self.assertEqual(category, 'python')
+        self.assertTrue(stack.endswith(
+            'core.tests:test_collapse_marks_category'))
+        template = Template('{{ frame }}')
+        frames = []
+
+        def capture():
+            frames.append(sys._getframe())
+            return ''
+
+        template.render(Context({'frame': capture}))
+        stack, category = collapse(frames[0])
+        self.assertEqual(category, 'template')
+        self.assertTrue(stack.startswith('template;'))
+
+
+class TemplateTimingTest(TestCase):
+    def test_nested_time_is_excluded(self):
+        """Собственное время шаблона не включает вложенные шаблоны"""
+        timings = TemplateTimings()
+        timings.enter()
+        timings.enter()
+        timings.exit('include.html', 0.25)
+        timings.exit('page.html', 1.0)
+        self.assertEqual(timings.totals, {
+            'include.html': (1, 0.25),
+            'page.html': (1, 0.75),
+        })
+        self.assertTrue(timings.header().startswith(
+            'tpl;dur=1000.000;desc="templates", tpl.page.html;dur=750.000'))
+
+    @override_settings(TEMPLATE_TIMING=True)
+    def test_response_has_server_timing(self):
+        """Ответ содержит время базового шаблона, страницы и include"""
+        cache.clear()
+        header = self.client.get('/')['Server-Timing']
+        for name in ('base.html', 'posts/index.html', 'includes/header.html',
+                     'posts/includes/paginator.html'):
+            with self.subTest(template=name):
+                self.assertIn(f'desc="{name} x', header)
+
+    @override_settings(TEMPLATE_TIMING=False)
+    def test_header_is_off_without_setting(self):
+        """Без TEMPLATE_TIMING замеры есть, а заголовка нет"""
+        cache.clear()
+        response = self.client.get('/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertIn('posts/index.html',
+                      response.wsgi_request.template_timings.totals)
+
+    def test_precompile_fills_cached_loader(self):
+        """precompile() кладёт все шаблоны в кеш cached.Loader"""
+        template = dict(settings.TEMPLATES[0])
+        template['OPTIONS'] = dict(template['OPTIONS'], loaders=[(
+            'django.template.loaders.cached.Loader',
+            ['django.template.loaders.filesystem.Loader',
+             'django.template.loaders.app_directories.Loader'],
+        )])
+        with override_settings(TEMPLATES=[template]):
+            self.assertGreater(precompile(), 0)
+            [loader] = engines['django'].engine.template_loaders
+            self.assertIn('posts/index.html', loader.get_template_cache)
+            self.assertIn('admin/base.html', loader.get_template_cache)
+
+
+@override_settings(METRICS_DIR='')
+class MetricsTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
+        self.registry = metrics.Registry()
+        self.counter = metrics.Counter(
+            'test_total', 'Счётчик', ['view'], registry=self.registry)
+        self.gauge = metrics.Gauge(
+            'test_in_flight', 'Gauge', registry=self.registry)
+        self.histogram = metrics.Histogram(
+            'test_seconds', 'Гистограмма', buckets=(0.1, 1),
+            registry=self.registry)
+
+    def test_exposition_format(self):
+        """Метрики выводятся в текстовом формате Prometheus"""
+        self.counter.inc(view='posts:index')
+        self.counter.inc(2, view='posts:index')
+        self.gauge.inc()
+        for value in (0.05, 0.5, 5):
+            self.histogram.observe(value)
+        text = metrics.exposition(self.registry.collect())
+        for line in (
+            '# TYPE test_total counter',
+            'test_total{view="posts:index"} 3',
+            'test_in_flight 1',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="0.1"} 1',
+            'test_seconds_bucket{le="1"} 2',
+            'test_seconds_bucket{le="+Inf"} 3',
+            'test_seconds_sum 5.55',
+            'test_seconds_count 3',
+        ):
+            with self.subTest(line=line):
+                self.assertIn(line + '\n', text)
+
+    def test_duplicate_name_is_rejected(self):
+        """Одно имя нельзя объявить дважды"""
+        with self.assertRaises(ValueError):
+            metrics.Counter('test_total', 'Снова', registry=self.registry)
+
+    def write_snapshot(self, pid):
+        self.counter.inc(view='posts:index')
+        self.gauge.inc()
+        self.histogram.observe(0.5)
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f'{pid}.json')
+        with open(path, 'w') as stream:
+            json.dump(self.registry.snapshot(), stream)
+        self.counter._values.clear()
+        self.gauge._values.clear()
+        self.histogram._values.clear()
+
+    @override_settings(METRICS_DIR=METRICS_DIR)
+    def test_snapshots_of_workers_are_summed(self):
+        """Счётчики складываются по всем воркерам, gauge - только свои"""
+        self.write_snapshot(os.getppid())
+        self.write_snapshot(DEAD_PID)
+        self.counter.inc(view='posts:index')
+        self.gauge.set(2)
+        for _ in range(2):
+            collected = self.registry.collect()
+            self.assertEqual(
+                collected['test_total']['samples'], [[['posts:index'], 3]])
+            self.assertEqual(
+                collected['test_in_flight']['samples'], [[[], 2]])
+            [[_, counts]] = collected['test_seconds']['samples']
+            self.assertEqual(counts, [0, 2, 1.0, 2])
+        files = os.listdir(METRICS_DIR)
+        self.assertIn(f'{os.getpid()}.json', files)
+        self.assertIn(metrics.RETIRED, files)
+        self.assertNotIn(f'{DEAD_PID}.json', files)
+
+    @override_settings(METRICS_DIR=METRICS_DIR)
+    def test_reused_pid_keeps_counters(self):
+        """Снимок прежнего воркера с тем же pid не затирается новым"""
+        self.write_snapshot(os.getpid())
+        self.counter.inc(view='posts:index')
+        collected = self.registry.collect()
+        self.assertEqual(
+            collected['test_total']['samples'], [[['posts:index'], 2]])
+
+    @override_settings(METRICS_DIR=METRICS_DIR, METRICS_FLUSH_INTERVAL=60)
+    def test_flush_is_throttled(self):
+        """Снимок пишется не чаще раза в METRICS_FLUSH_INTERVAL"""
+        path = os.path.join(METRICS_DIR, f'{os.getpid()}.json')
+        self.registry.flush()
+        os.remove(path)
+        self.registry.flush()
+        self.assertFalse(os.path.exists(path))
+        self.registry.flush(force=True)
+        self.assertTrue(os.path.exists(path))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint_reports_requests(self):
+        """/metrics показывает время ответа и запросы к базе по маршрутам"""
+        cache.clear()
+        self.client.get('/')
+        response = self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        for prefix in (
+            'http_request_duration_seconds_count'
+            '{view="posts:index",method="GET"} ',
+            'http_requests_total'
+            '{view="posts:index",method="GET",status="200"} ',
+            'db_queries_total{view="posts:index"} ',
+            'template_renders_total{template="posts/index.html"} ',
+            'cache_lookups_total{cache="page",result="miss"} ',
+            'http_requests_in_flight 1',
+        ):
+            with self.subTest(prefix=prefix):
+                self.assertIn('\n' + prefix, text)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint_requires_token(self):
+        """С METRICS_TOKEN эндпоинт отвечает только с верным токеном"""
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_endpoint_without_token_is_closed(self):
+        """Без METRICS_TOKEN метрики видны только при DEBUG с INTERNAL_IPS"""
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+            response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.1')
+            self.assertEqual(response.status_code, 401)
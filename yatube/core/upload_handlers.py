@@ -0,0 +1,73 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import ImageFile
+
+# Сколько первых байт файла показывать Pillow в поисках размеров картинки
+HEADER_PEEK = 64 * 1024
+
+
+class RejectedUpload(UploadedFile):
+    """Файл, отклонённый ещё при приёме запроса. Данных в нём нет,
+    в `reason` - объяснение для пользователя."""
+
+    def __init__(self, name, content_type, size, reason):
+        super().__init__(BytesIO(), name, content_type, size)
+        self.reason = reason
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """Проверяет загружаемые файлы по мере приёма, до буферизации.
+
+    Файл больше `UPLOAD_MAX_SIZE` байт или картинка, у которой в
+    заголовке больше `UPLOAD_MAX_PIXELS` пикселей, дальше не читаются
+    и приходят в `request.FILES` как `RejectedUpload`. Должен стоять
+    первым в `FILE_UPLOAD_HANDLERS`.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.parser = ImageFile.Parser()
+        self.reason = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.reason:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_SIZE:
+            limit = filesizeformat(settings.UPLOAD_MAX_SIZE)
+            self.reason = f'Файл больше допустимых {limit}'
+        else:
+            self.reason = self.check_dimensions(raw_data)
+        return None if self.reason else raw_data
+
+    def check_dimensions(self, raw_data):
+        if self.parser is None:
+            return None
+        try:
+            self.parser.feed(raw_data)
+        except Exception:
+            # Не картинка или битый заголовок - решит поле формы
+            self.parser = None
+            return None
+        if self.parser.image is None:
+            if self.received > HEADER_PEEK:
+                self.parser = None
+            return None
+        width, height = self.parser.image.size
+        self.parser = None
+        if width * height > settings.UPLOAD_MAX_PIXELS:
+            return (f'Картинка {width}x{height} слишком большая, '
+                    f'допустимо до {settings.UPLOAD_MAX_PIXELS} пикселей')
+        return None
+
+    def file_complete(self, file_size):
+        if self.reason:
+            return RejectedUpload(
+                self.file_name, self.content_type, self.received,
+                self.reason)
+        return None
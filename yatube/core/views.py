@@ -1,5 +1,11 @@
 # core/views.py
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+
+from . import metrics
 
 
 def page_not_found(request, exception):
@@ -18,3 +24,27 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics_allowed(request):
+    """С `METRICS_TOKEN` нужен заголовок `Authorization: Bearer <токен>`.
+    Без токена метрики видны только при `DEBUG` и только с
+    `INTERNAL_IPS`: за прокси все запросы приходят с его адреса."""
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        given = request.META.get('HTTP_AUTHORIZATION', '')
+        return constant_time_compare(given, expected)
+    return (settings.DEBUG
+            and request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS)
+
+
+@never_cache
+def metrics_view(request):
+    """Метрики всех воркеров в текстовом формате Prometheus."""
+    if not metrics_allowed(request):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(
+        metrics.exposition(metrics.REGISTRY.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
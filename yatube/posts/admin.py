@@ -1,8 +1,36 @@
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.forms import ModelForm
 from .models import Post, Group
+from .utils import EstimatedCountPaginator
 # Register your models here.
 
 
+class LoadedAutocompleteSelect(AutocompleteSelect):
+    """Автодополнение, которое не ищет в базе уже загруженный объект."""
+    instance = None
+
+    def optgroups(self, name, value, attr=None):
+        instance = self.instance
+        if instance is None or [str(v) for v in value] != [str(instance.pk)]:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        label = self.choices.field.label_from_instance(instance)
+        options.append(self.create_option(
+            name, instance.pk, label, True, len(options)))
+        return [(None, options, 0)]
+
+
+class PostChangeListForm(ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Группа строки уже загружена через list_select_related
+        widget = self.fields['group'].widget
+        getattr(widget, 'widget', widget).instance = self.instance.group
+
+
 class PostsAdmin(admin.ModelAdmin):
     list_display = (
         'pk',
@@ -12,10 +40,34 @@ class PostsAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    # Без фильтров число постов оценивается по статистике базы,
+    # а второй COUNT(*) для «показать все» не выполняется
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'group':
+            kwargs['widget'] = LoadedAutocompleteSelect(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_changelist_form(self, request, **kwargs):
+        kwargs.setdefault('form', PostChangeListForm)
+        return super().get_changelist_form(request, **kwargs)
+
+
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'title', 'slug', 'posts_count')
+    search_fields = ('title', 'slug')
+    ordering = ('title',)
+
 
 admin.site.register(Post, PostsAdmin)
-admin.site.register(Group)
+admin.site.register(Group, GroupAdmin)
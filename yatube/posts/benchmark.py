@@ -0,0 +1,255 @@
+"""Воспроизводимый замер скорости маршрутов `posts.urls`.
+
+Каждый маршрут вызывается `iterations` раз от имени самого активного
+читателя из набора `posts.synthetic`. Для маршрута считаются перцентили
+задержки, число SQL-запросов на запрос (по заголовку
+`X-DB-Query-Count`) и пропускная способность. Запросы идут через
+тестовый клиент Django или через WSGI-сервер в этом же процессе, так
+что сеть не нужна.
+"""
+import threading
+import time
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.test import Client
+from django.urls import reverse
+
+from .models import Follow, Post, User
+from .search import WORD
+
+PERCENTILES = (50, 95, 99)
+# По скольким первым страницам листингов расходятся запросы
+PAGES = 5
+
+
+def percentile(values, q):
+    """Перцентиль с линейной интерполяцией, как у `numpy.percentile`."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (
+        ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def dataset_sizes(posts):
+    """Пропорции набора данных `posts.synthetic` для числа постов."""
+    return {
+        'users': max(posts // 20, 10),
+        'groups': max(posts // 500, 3),
+        'posts': posts,
+        'comments': posts * 2,
+        'follows': 20,
+    }
+
+
+class ClientTransport:
+    """Запросы через `django.test.Client`, без HTTP."""
+    name = 'client'
+
+    def __init__(self):
+        self.client = Client()
+
+    def login(self, user):
+        self.client.force_login(user)
+
+    def request(self, method, url, data=None):
+        response = getattr(self.client, method)(url, data=data)
+        return (response.status_code,
+                int(response.get('X-DB-Query-Count', 0)))
+
+    def close(self):
+        pass
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class ServerTransport:
+    """HTTP к серверу `wsgiref` в отдельном потоке этого процесса:
+    замер включает разбор HTTP и весь WSGI-стек."""
+    name = 'server'
+
+    def __init__(self):
+        self.server = make_server(
+            '127.0.0.1', 0, get_wsgi_application(),
+            handler_class=QuietHandler)
+        threading.Thread(
+            target=self.server.serve_forever, daemon=True).start()
+        # Одна и та же CSRF-метка уходит в cookie и в заголовке
+        request = HttpRequest()
+        self.csrf_token = get_token(request)
+        self.cookies = {settings.CSRF_COOKIE_NAME: request.META['CSRF_COOKIE']}
+
+    def login(self, user):
+        client = Client()
+        client.force_login(user)
+        name = settings.SESSION_COOKIE_NAME
+        self.cookies[name] = client.cookies[name].value
+
+    def request(self, method, url, data=None):
+        headers = {'Cookie': '; '.join(
+            f'{name}={value}' for name, value in self.cookies.items())}
+        body = None
+        if method == 'get' and data:
+            url = f'{url}?{urlencode(data)}'
+        elif method == 'post':
+            body = urlencode(data or {})
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['X-CSRFToken'] = self.csrf_token
+        connection = HTTPConnection(*self.server.server_address)
+        try:
+            connection.request(method.upper(), url, body, headers)
+            response = connection.getresponse()
+            response.read()
+            return (response.status,
+                    int(response.getheader('X-DB-Query-Count', 0)))
+        finally:
+            connection.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+TRANSPORTS = {
+    'client': ClientTransport,
+    'server': ServerTransport,
+}
+
+
+def choose_reader():
+    """Читатель с наибольшим числом подписок среди пишущих авторов."""
+    return (
+        User.objects.filter(stats__posts_count__gt=0)
+        .order_by('-stats__following_count', 'pk').first()
+    )
+
+
+def scenarios(reader):
+    """Как обратиться к каждому маршруту `posts.urls` на i-й итерации.
+
+    Сначала идут чтения, потом записи, чтобы созданные замером посты
+    не меняли данные листингов. Подписки расходятся по разным авторам,
+    а отписки потом снимают их в том же порядке.
+    """
+    post = (
+        Post.objects.exclude(group=None).select_related('author', 'group')
+        .order_by('-comments_count', 'pk').first()
+    )
+    own = reader.posts.order_by('-pub_date').first()
+    strangers = list(
+        User.objects.exclude(pk=reader.pk)
+        .exclude(pk__in=Follow.objects.filter(
+            user=reader).values('author_id'))
+        .order_by('pk').values_list('username', flat=True)
+    ) or [post.author.username]
+    words = WORD.findall(post.text) or ['пост']
+
+    def page(i):
+        return {'page': 1 + i % PAGES}
+
+    def stranger(i):
+        return strangers[i % len(strangers)]
+
+    return {
+        'index': lambda i: ('get', reverse('posts:index'), page(i)),
+        'group_list': lambda i: (
+            'get', reverse('posts:group_list', args=[post.group.slug]),
+            page(i)),
+        'profile': lambda i: (
+            'get', reverse('posts:profile', args=[post.author.username]),
+            page(i)),
+        'post_detail': lambda i: (
+            'get', reverse('posts:post_detail', args=[post.pk]), None),
+        'search': lambda i: (
+            'get', reverse('posts:search'),
+            {'q': words[i % len(words)]}),
+        'group_autocomplete': lambda i: (
+            'get', reverse('posts:group_autocomplete'),
+            {'term': post.group.title[:2]}),
+        'follow_index': lambda i: (
+            'get', reverse('posts:follow_index'), page(i)),
+        'post_create': lambda i: (
+            'post', reverse('posts:post_create'),
+            {'text': f'Пост замера {i}', 'group': post.group_id}),
+        'post_edit': lambda i: (
+            'post', reverse('posts:post_edit', args=[own.pk]),
+            {'text': f'Правка замера {i}', 'group': post.group_id}),
+        'add_comment': lambda i: (
+            'post', reverse('posts:add_comment', args=[post.pk]),
+            {'text': f'Комментарий замера {i}'}),
+        'profile_follow': lambda i: (
+            'get', reverse('posts:profile_follow', args=[stranger(i)]),
+            None),
+        'profile_unfollow': lambda i: (
+            'get', reverse('posts:profile_unfollow', args=[stranger(i)]),
+            None),
+    }
+
+
+def measure(transport, build, iterations, warmup=0):
+    """Задержки одного маршрута; первые `warmup` запросов не в счёт."""
+    latencies = []
+    queries = errors = 0
+    for i in range(warmup + iterations):
+        method, url, data = build(i)
+        started = time.perf_counter()
+        status, count = transport.request(method, url, data)
+        elapsed = time.perf_counter() - started
+        if i < warmup:
+            continue
+        latencies.append(elapsed)
+        queries += count
+        errors += status >= 400
+    result = {'requests': iterations}
+    for q in PERCENTILES:
+        result[f'p{q}_ms'] = round(percentile(latencies, q) * 1000, 3)
+    result.update({
+        'mean_ms': round(sum(latencies) / iterations * 1000, 3),
+        'queries_per_request': round(queries / iterations, 2),
+        'throughput_rps': round(iterations / sum(latencies), 1),
+        'errors': errors,
+    })
+    return result
+
+
+def run(transport, iterations, warmup=0, routes=None):
+    """Замеряет маршруты (все или `routes`) на данных в базе."""
+    reader = choose_reader()
+    transport.login(reader)
+    results = {}
+    for name, build in scenarios(reader).items():
+        if routes and name not in routes:
+            continue
+        results[name] = measure(transport, build, iterations, warmup)
+    return results
+
+
+def compare(previous, current):
+    """Строки «маршрут, размер, было, стало» по p50 и p95 для двух
+    прогонов с одинаковыми размерами наборов данных."""
+    before = {
+        (size['posts'], route): stats
+        for size in previous['sizes']
+        for route, stats in size['routes'].items()
+    }
+    rows = []
+    for size in current['sizes']:
+        for route, stats in size['routes'].items():
+            old = before.get((size['posts'], route))
+            if old is None:
+                continue
+            rows.append((route, size['posts'], {
+                key: (old[key], stats[key])
+                for key in ('p50_ms', 'p95_ms', 'queries_per_request')
+            }))
+    return rows
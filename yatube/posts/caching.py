@@ -0,0 +1,129 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.stampede import get_or_compute
+
+VERSION_PREFIX = 'posts:version'
+PAGE_PREFIX = 'posts:page'
+CARD_PREFIX = 'posts:card'
+
+
+def version_key(*scope):
+    """Ключ версии области: `posts`, `group:<id>`, `author:<id>`..."""
+    return ':'.join([VERSION_PREFIX, *map(str, scope)])
+
+
+def _initial_version():
+    # Версия, созданная после вытеснения ключа, не совпадёт со старой.
+    return time.time_ns() // 1000
+
+
+def versions(keys):
+    """Текущие версии для ключей версий, одним обращением к кешу."""
+    current = cache.get_many(keys)
+    for key in set(keys) - set(current):
+        cache.add(key, _initial_version(), None)
+        current[key] = cache.get(key)
+    return current
+
+
+def bump(scopes):
+    """Инвалидирует всё, что было построено по этим областям."""
+    for scope in scopes:
+        key = version_key(*scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+
+
+def bump_on_commit(scopes):
+    """`bump` сейчас и ещё раз после коммита текущей транзакции.
+
+    Первый сдвиг нужен коду в той же транзакции, второй сбрасывает
+    страницы, которые другие запросы успели собрать из старых данных
+    до коммита. При откате остаётся только лишний промах кеша."""
+    scopes = list(scopes)
+    bump(scopes)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump(scopes))
+
+
+def post_scopes(post):
+    """Области страниц, на которых показан пост."""
+    return [('posts',), ('author', post.author_id),
+            ('post', post.pk), ('group', post.group_id)]
+
+
+def cards_version(request):
+    """Версия всех карточек постов: в них есть имена авторов и группы.
+
+    Читается один раз за запрос."""
+    version = getattr(request, '_cards_version', None)
+    if version is None:
+        version = depends(request, ('users',), ('groups',))
+        if request is not None:
+            request._cards_version = version
+    return version
+
+
+def card_key(post_id, version):
+    return f'{CARD_PREFIX}:{post_id}:{version}'
+
+
+def attach_cards(posts, version):
+    """Читает закешированные карточки страницы одним `get_many`;
+    тег `post_card` пересчитывает только те, которых не нашлось."""
+    keys = {card_key(post.pk, version): post for post in posts}
+    cached = cache.get_many(list(keys))
+    for key, post in keys.items():
+        post.cached_card = (key, cached.get(key))
+
+
+def depends(request, *scopes):
+    """Отмечает, от каких областей зависит страница, и возвращает строку
+    их версий - её удобно добавлять к ключам кеша фрагментов."""
+    current = versions([version_key(*scope) for scope in scopes])
+    if hasattr(request, 'page_versions'):
+        request.page_versions.update(current)
+    return '.'.join(str(current[key]) for key in sorted(current))
+
+
+def cache_anonymous_page(view):
+    """Кеширует ответы анонимным читателям до смены версий областей,
+    объявленных представлением через `depends`.
+
+    Пересчёт идёт через `get_or_compute`: после смены версии страницу
+    рендерит один воркер, остальные пока отдают предыдущую."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated):
+            return view(request, *args, **kwargs)
+        path = request.get_full_path().encode()
+        key = f'{PAGE_PREFIX}:{hashlib.md5(path).hexdigest()}'
+
+        def render():
+            request.page_versions = {}
+            response = view(request, *args, **kwargs)
+            return request.page_versions, response
+
+        _, response = get_or_compute(
+            key, render, settings.PAGE_CACHE_TIMEOUT, is_valid=_is_current,
+            name='page')
+        return response
+    return wrapper
+
+
+def _is_current(entry):
+    snapshot, response = entry
+    return (
+        response.status_code == 200
+        and bool(snapshot)
+        and versions(list(snapshot)) == snapshot
+    )
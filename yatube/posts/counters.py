@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+KEY_PREFIX = 'posts:count'
+
+
+def scope_key(*scope):
+    """Ключ счётчика: `all` или `feed:<user_id>`.
+
+    Посты группы и автора считают поля `Group.posts_count` и
+    `UserStats.posts_count`."""
+    return ':'.join([KEY_PREFIX, *map(str, scope)])
+
+
+def get_count(scope, queryset):
+    """Возвращает число постов в области из кеша, считая его один раз."""
+    key = scope_key(*scope)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.POST_COUNTS_TIMEOUT)
+    return count
+
+
+def adjust(scopes, delta):
+    """Сдвигает закешированные счётчики после коммита транзакции.
+
+    Отсутствующие посчитаются заново, а при откате счётчик не трогается."""
+    keys = [scope_key(*scope) for scope in scopes]
+
+    def apply():
+        for key in keys:
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                pass
+
+    transaction.on_commit(apply)
+
+
+def forget(scopes):
+    """Сбрасывает счётчики сейчас и ещё раз после коммита.
+
+    Второй сброс убирает число, которое другой запрос успел посчитать
+    до коммита по старым данным."""
+    keys = [scope_key(*scope) for scope in scopes]
+    cache.delete_many(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,169 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max, Q
+
+from . import caching
+from .models import FeedEntry, Follow, Post, UserStats
+
+
+def is_celebrity(author_id):
+    """Авторы с огромным числом подписчиков читаются при чтении ленты.
+
+    Признак `UserStats.celebrity` ставит `subscribe`, когда подписчиков
+    больше `FEED_FANOUT_LIMIT`, а снимает `resume_fanout`."""
+    return UserStats.objects.filter(
+        user_id=author_id, celebrity=True).exists()
+
+
+def _insert(entries):
+    # Django 2.2 не урезает явный batch_size до предела базы (в SQLite
+    # это 999 параметров на запрос), поэтому выбираем меньший из двух
+    fields = [field for field in FeedEntry._meta.concrete_fields
+              if not field.primary_key]
+    batch_size = min(1000, connection.ops.bulk_batch_size(fields, entries))
+    FeedEntry.objects.bulk_create(
+        entries, batch_size=max(batch_size, 1), ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора.
+
+    Возвращает False для знаменитостей: их посты не раскладываются."""
+    if is_celebrity(post.author_id):
+        return False
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    _insert([
+        FeedEntry(user_id=user_id, post=post,
+                  author_id=post.author_id, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    ])
+    return True
+
+
+def backfill(user_ids, author_id, after=None):
+    """Кладёт последние посты автора в ленты указанных читателей.
+
+    С `after` - только посты с большим первичным ключом."""
+    posts = Post.objects.filter(author_id=author_id)
+    if after is not None:
+        posts = posts.filter(pk__gt=after)
+    posts = posts.order_by('-pub_date').values_list(
+        'pk', 'pub_date')[:settings.FEED_BACKFILL]
+    _insert([
+        FeedEntry(user_id=user_id, post_id=post_id,
+                  author_id=author_id, pub_date=pub_date)
+        for post_id, pub_date in posts
+        for user_id in user_ids
+    ])
+
+
+def _backfill_followers(author_id, chunk_size, after=None):
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    user_ids = []
+    for user_id in followers.iterator():
+        user_ids.append(user_id)
+        if len(user_ids) == chunk_size:
+            backfill(user_ids, author_id, after)
+            user_ids = []
+    if user_ids:
+        backfill(user_ids, author_id, after)
+
+
+def rebuild(chunk_size=100):
+    """Заново раскладывает посты по лентам всех подписчиков,
+    например после массового импорта подписок и постов."""
+    UserStats.objects.filter(
+        followers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).update(celebrity=True)
+    UserStats.objects.filter(
+        followers_count__lte=settings.FEED_FANOUT_RESUME,
+    ).update(celebrity=False)
+    authors = (
+        Follow.objects.order_by().values_list('author_id', flat=True)
+        .distinct()
+    )
+    for author_id in authors.iterator():
+        if not is_celebrity(author_id):
+            _backfill_followers(author_id, chunk_size)
+
+
+def resume_fanout(chunk_size=100):
+    """Возвращает раскладку по лентам знаменитостям, у которых
+    подписчиков стало не больше `FEED_FANOUT_RESUME`.
+
+    Пока посты раскладываются, автор остаётся знаменитостью и его посты
+    домешиваются при чтении. Посты, вышедшие за это время, докладываются
+    после снятия признака. Возвращает число таких авторов."""
+    authors = list(
+        UserStats.objects.filter(
+            celebrity=True,
+            followers_count__lte=settings.FEED_FANOUT_RESUME,
+        ).values_list('user_id', flat=True)
+    )
+    for author_id in authors:
+        latest = Post.objects.filter(
+            author_id=author_id).aggregate(latest=Max('pk'))['latest']
+        _backfill_followers(author_id, chunk_size)
+        UserStats.objects.filter(user_id=author_id).update(celebrity=False)
+        _backfill_followers(author_id, chunk_size, after=latest or 0)
+    return len(authors)
+
+
+def subscribe(follow):
+    UserStats.objects.filter(
+        user_id=follow.author_id,
+        celebrity=False,
+        followers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).update(celebrity=True)
+    if not is_celebrity(follow.author_id):
+        backfill([follow.user_id], follow.author_id)
+
+
+def unsubscribe(follow):
+    """Убирает автора из ленты читателя.
+
+    Знаменитость, у которой стало меньше подписчиков, остаётся ею до
+    `resume_fanout`: раскладывать её посты в запросе слишком долго."""
+    FeedEntry.objects.filter(
+        user_id=follow.user_id, author_id=follow.author_id).delete()
+
+
+def followed_celebrities(user):
+    """Авторы-знаменитости, на которых подписан пользователь."""
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__celebrity=True,
+        ).values_list('author_id', flat=True)
+    )
+
+
+def count_scope(user, celebrities):
+    """Область `posts.counters` для числа постов в ленте.
+
+    Посты знаменитостей не сбрасывают счётчики лент всех подписчиков:
+    вместо этого в область входят версии `('author', id)` из
+    `posts.caching`, и новый пост знаменитости меняет область."""
+    if not celebrities:
+        return ('feed', user.pk)
+    keys = [caching.version_key('author', pk) for pk in sorted(celebrities)]
+    current = caching.versions(keys)
+    return ('feed', user.pk, *(current[key] for key in keys))
+
+
+def feed(user, celebrities=None):
+    """Лента подписок: одно индексное чтение по `(user, -pub_date)`.
+
+    Посты авторов-знаменитостей домешиваются при чтении."""
+    if celebrities is None:
+        celebrities = followed_celebrities(user)
+    posts = Post.objects.select_related('author', 'group')
+    if not celebrities:
+        return posts.filter(feed_entries__user=user).order_by(
+            '-feed_entries__pub_date', '-pk')
+    entries = FeedEntry.objects.filter(user=user).values('post_id')
+    return posts.filter(
+        Q(pk__in=entries) | Q(author_id__in=celebrities)
+    ).order_by('-pub_date', '-pk')
@@ -1,12 +1,86 @@
-from django.forms import ModelForm
-from .models import Post, Comment
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.forms import (CharField, Form, ModelChoiceField, ModelForm,
+                          Select)
+from django.urls import reverse_lazy
+
+from core.stampede import get_or_compute
+from core.upload_handlers import RejectedUpload
+from .caching import depends
+from .images import shrink_original
+from .models import Comment, Group, Post
+
+GROUP_CHOICES_KEY = 'posts:group-choices'
+
+
+def group_choices():
+    """Группы для формы поста из кеша: `[(id, название), ...]`.
+
+    Кеш сбрасывается при изменении любой группы. Если групп больше
+    `GROUP_CHOICES_LIMIT`, возвращает None: тогда форма подгружает
+    группы по мере ввода.
+    """
+    version = depends(None, ('groups',))
+
+    def compute():
+        limit = settings.GROUP_CHOICES_LIMIT
+        groups = list(
+            Group.objects.order_by('pk').values_list('pk', 'title')
+            [:limit + 1]
+        )
+        return version, groups if len(groups) <= limit else None
+
+    _, choices = get_or_compute(
+        GROUP_CHOICES_KEY, compute, None,
+        is_valid=lambda value: value[0] == version, name='group_choices')
+    return choices
+
+
+class GroupAutocompleteSelect(Select):
+    """Список только с выбранной группой, остальные подгружаются
+    по мере ввода из `posts:group_autocomplete`."""
+
+    def __init__(self, attrs=None):
+        attrs = {'data-autocomplete-url':
+                 reverse_lazy('posts:group_autocomplete'), **(attrs or {})}
+        super().__init__(attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        self.choices = list(
+            Group.objects.filter(pk__in=[pk for pk in value if pk])
+            .values_list('pk', 'title')
+        )
+        return super().optgroups(name, value, attrs)
 
 
 class PostForm(ModelForm):
     def __init__(self, *args, **kwargs):
         super(PostForm, self).__init__(*args, **kwargs)
-        self.fields['group'].empty_label = None
-        self.fields['group'].widget.choices = self.fields['group'].choices
+        group = self.fields['group']
+        group.empty_label = None
+        choices = group_choices()
+        if choices is None:
+            group.widget = GroupAutocompleteSelect()
+            group.widget.is_required = group.required
+        else:
+            group.choices = choices
+        # Файл, отклонённый при приёме запроса, полю не показываем:
+        # в нём нет данных, ошибку выдаст clean_image
+        self.rejected_image = self.files.get('image')
+        if isinstance(self.rejected_image, RejectedUpload):
+            self.files = self.files.copy()
+            self.files.pop('image')
+        else:
+            self.rejected_image = None
+
+    def clean_image(self):
+        if self.rejected_image:
+            raise ValidationError(self.rejected_image.reason)
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return shrink_original(image)
+        return image
 
     class Meta:
         model = Post
@@ -21,3 +95,15 @@ class CommentForm(ModelForm):
     class Meta:
         model = Comment
         fields = ('text',)
+
+
+class SearchForm(Form):
+    q = CharField(label='Что искать', max_length=200)
+    group = ModelChoiceField(
+        Group.objects.all(),
+        to_field_name='slug',
+        required=False,
+        empty_label='Все группы',
+        label='Группа',
+    )
+    author = CharField(label='Автор', max_length=150, required=False)
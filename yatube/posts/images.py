@@ -0,0 +1,203 @@
+import hashlib
+import logging
+from io import BytesIO
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS
+
+from core.metrics import Counter, Histogram
+
+from . import caching
+from .models import Post, PostThumbnail
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_PREFIX = 'posts:variants'
+
+THUMBNAILS = Counter(
+    'thumbnails_generated_total',
+    'Обработанные картинки постов: ok, failed или skipped (пост удалён '
+    'или картинку заменили)', ['status'])
+THUMBNAIL_SECONDS = Histogram(
+    'thumbnail_render_seconds', 'Время построения всех вариантов картинки',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='post-images',
+            )
+    return _executor
+
+
+def enqueue(post):
+    """Ставит картинку поста в очередь после коммита транзакции."""
+    post_id, name = post.pk, post.image.name
+    transaction.on_commit(lambda: submit(post_id, name))
+
+
+def submit(post_id, name):
+    if not settings.IMAGE_WORKERS:
+        process(post_id, name)
+        return
+    executor().submit(_run, post_id, name)
+
+
+def _run(post_id, name):
+    try:
+        process(post_id, name)
+    finally:
+        # У каждого потока пула свои соединения с базой
+        connections.close_all()
+
+
+def shrink_original(upload):
+    """Уменьшает загруженный оригинал до `POST_IMAGE_MAX_SIDE` пикселей
+    по длинной стороне, чтобы не хранить и не декодировать снова полный
+    размер с камеры. Анимированные картинки остаются как есть."""
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    if max(upload.image.size) <= max_side:
+        return upload
+    upload.seek(0)
+    with Image.open(upload) as image:
+        if getattr(image, 'is_animated', False):
+            return upload
+        fmt = image.format
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        options = {}
+        if fmt == 'JPEG':
+            image = image.convert('RGB')
+            options = {'quality': settings.POST_IMAGE_QUALITY,
+                       'optimize': True}
+        buffer = BytesIO()
+        image.save(buffer, fmt, **options)
+    return SimpleUploadedFile(
+        upload.name, buffer.getvalue(), upload.content_type)
+
+
+def variants_key(post_id, name):
+    digest = hashlib.md5(name.encode()).hexdigest()
+    return f'{VARIANTS_PREFIX}:{post_id}:{digest}'
+
+
+def attach_variants(posts):
+    """Подгружает готовые варианты картинок для страницы постов.
+
+    Все посты страницы читаются из кеша одним `get_many`; в базу идёт
+    один запрос только за теми, кого в кеше не оказалось.
+    """
+    ready = {}
+    for post in posts:
+        post.set_image_variants({})
+        if post.image_ready:
+            ready[variants_key(post.pk, post.image.name)] = post
+    if not ready:
+        return
+    cached = cache.get_many(list(ready))
+    missing = {key: post for key, post in ready.items()
+               if key not in cached}
+    if missing:
+        found = {key: {} for key in missing}
+        keys = {post.pk: key for key, post in missing.items()}
+        thumbs = PostThumbnail.objects.filter(
+            post_id__in=[post.pk for post in missing.values()])
+        for thumb in thumbs:
+            found[keys[thumb.post_id]][thumb.variant] = thumb
+        cache.set_many(found, settings.IMAGE_VARIANTS_TIMEOUT)
+        cached.update(found)
+    for key, post in ready.items():
+        post.set_image_variants(cached[key])
+
+
+def extra_formats():
+    """Форматы из `POST_IMAGE_FORMATS`, которые умеют сохранять и Pillow,
+    и sorl-thumbnail в этой сборке."""
+    Image.init()
+    return [fmt for fmt in settings.POST_IMAGE_FORMATS
+            if fmt in Image.SAVE and fmt in EXTENSIONS]
+
+
+def variant_specs():
+    """Все варианты для подготовки: `(имя, геометрия, параметры, формат)`.
+
+    Каждый вариант из `POST_IMAGE_VARIANTS` готовится ещё и в ширинах
+    `POST_IMAGE_WIDTHS` (`card-480w`) и в дополнительных форматах
+    (`card-480w.webp`); формат '' - формат sorl по умолчанию.
+    """
+    specs = []
+    formats = extra_formats()
+    for name, (geometry, options) in settings.POST_IMAGE_VARIANTS.items():
+        width, height = map(int, geometry.split('x'))
+        for size in sorted({width, *settings.POST_IMAGE_WIDTHS}):
+            size_geometry = f'{size}x{round(height * size / width)}'
+            variant = name if size == width else f'{name}-{size}w'
+            specs.append((variant, size_geometry, options, ''))
+            for fmt in formats:
+                specs.append((
+                    f'{variant}.{EXTENSIONS[fmt]}', size_geometry,
+                    dict(options, format=fmt), fmt,
+                ))
+    return specs
+
+
+def render_variants(post):
+    """Строит все варианты из `variant_specs()`."""
+    variants = []
+    for variant, geometry, options, fmt in variant_specs():
+        thumb = get_thumbnail(post.image, geometry, **options)
+        variants.append(PostThumbnail(
+            post=post, variant=variant, url=thumb.url, format=fmt,
+            width=thumb.width, height=thumb.height,
+        ))
+    return variants
+
+
+def process(post_id, name):
+    """Готовит все варианты картинки и отмечает пост готовым к показу.
+
+    Если пост удалили или картинку успели заменить, ничего не делает:
+    новая картинка уже стоит в очереди. Возвращает True, если варианты
+    сохранены.
+    """
+    post = Post.objects.filter(pk=post_id, image=name).only(
+        'pk', 'image', 'author_id', 'group_id').first()
+    if post is None:
+        THUMBNAILS.inc(status='skipped')
+        return False
+    started = time.perf_counter()
+    try:
+        variants = render_variants(post)
+    except Exception:
+        logger.exception('Не удалось обработать картинку поста %s', post_id)
+        THUMBNAILS.inc(status='failed')
+        return False
+    THUMBNAIL_SECONDS.observe(time.perf_counter() - started)
+    with transaction.atomic():
+        # `updated` - версия карточки поста, она должна показать картинку
+        updated = Post.objects.filter(pk=post_id, image=name).update(
+            image_ready=True, updated=timezone.now())
+        if updated:
+            PostThumbnail.objects.filter(post_id=post_id).delete()
+            PostThumbnail.objects.bulk_create(variants)
+    THUMBNAILS.inc(status='ok' if updated else 'skipped')
+    if updated:
+        cache.delete(variants_key(post_id, name))
+        caching.bump(caching.post_scopes(post))
+    return bool(updated)
@@ -0,0 +1,136 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from posts import benchmark
+from posts.synthetic import Generator
+
+
+def sizes(value):
+    try:
+        return [int(size) for size in value.split(',')]
+    except ValueError:
+        raise CommandError('--sizes: числа постов через запятую')
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеряет маршруты posts.urls на синтетических наборах данных '
+            'растущего размера во временной тестовой базе: p50/p95/p99, '
+            'SQL-запросы на запрос и пропускную способность. Результаты '
+            'можно сохранить в JSON и сравнить с прошлым прогоном')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=sizes, default=[1000, 10000],
+            help='Размеры наборов в постах через запятую',
+        )
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Сколько первых запросов к маршруту не учитывать',
+        )
+        parser.add_argument(
+            '--transport', choices=list(benchmark.TRANSPORTS),
+            default='client',
+            help='client - тестовый клиент, server - локальный WSGI-сервер',
+        )
+        parser.add_argument(
+            '--routes', type=lambda value: value.split(','),
+            help='Только эти маршруты, через запятую',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Куда сохранить JSON')
+        parser.add_argument(
+            '--compare', help='JSON прошлого прогона для сравнения')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должно быть больше нуля')
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as stream:
+                previous = json.load(stream)
+        report = {
+            'created': timezone.now().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'transport': options['transport'],
+            'iterations': options['iterations'],
+            'warmup': options['warmup'],
+            'seed': options['seed'],
+            'sizes': [],
+        }
+        # Замер идёт как в продакшене: без DEBUG, но с заголовками
+        # числа запросов и с хостом тестового клиента
+        with override_settings(
+                DEBUG=False, QUERY_STATS_HEADERS=True,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for posts in options['sizes']:
+                report['sizes'].append(self.run_size(posts, options))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                json.dump(report, stream, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["output"]}')
+        if previous:
+            self.print_comparison(previous, report)
+
+    def run_size(self, posts, options):
+        self.stdout.write(f'Набор данных: {posts} постов')
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # Версии и фрагменты прошлого набора не должны попасть в замер
+            cache.clear()
+            dataset = Generator(seed=options['seed']).generate(
+                **benchmark.dataset_sizes(posts))
+            transport = benchmark.TRANSPORTS[options['transport']]()
+            try:
+                routes = benchmark.run(
+                    transport, options['iterations'], options['warmup'],
+                    options['routes'])
+            finally:
+                transport.close()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.print_table(routes)
+        return {'posts': posts, 'dataset': dataset, 'routes': routes}
+
+    def print_table(self, routes):
+        self.stdout.write(
+            f'{"маршрут":<20}{"p50 мс":>10}{"p95 мс":>10}{"p99 мс":>10}'
+            f'{"запросы":>10}{"зап/с":>10}{"ошибки":>8}')
+        for name, stats in routes.items():
+            self.stdout.write(
+                f'{name:<20}{stats["p50_ms"]:>10.2f}{stats["p95_ms"]:>10.2f}'
+                f'{stats["p99_ms"]:>10.2f}'
+                f'{stats["queries_per_request"]:>10.1f}'
+                f'{stats["throughput_rps"]:>10.1f}{stats["errors"]:>8}')
+
+    def print_comparison(self, previous, report):
+        self.stdout.write(
+            f'Сравнение с {previous.get("commit") or "прошлым прогоном"}:')
+        for route, posts, changes in benchmark.compare(previous, report):
+            diff = ', '.join(
+                f'{key} {old} -> {new}'
+                for key, (old, new) in changes.items())
+            self.stdout.write(f'{route} [{posts}]: {diff}')
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Выгружает группы, посты, комментарии или подписки в JSON Lines '
+            'или CSV, не загружая таблицу в память целиком')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=list(transfer.MODELS))
+        parser.add_argument(
+            '--output', default='-',
+            help='Файл для выгрузки, по умолчанию stdout',
+        )
+        parser.add_argument(
+            '--format', choices=list(transfer.FORMATS),
+            help='Формат; по умолчанию по расширению файла, иначе jsonl',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Сколько строк читать из базы за раз',
+        )
+
+    def handle(self, *args, **options):
+        name, output = options['model'], options['output']
+        file_format = transfer.FORMATS[
+            options['format'] or transfer.guess_format(output)]
+        rows = transfer.export_rows(name, options['chunk_size'])
+        if output == '-':
+            file_format.write(sys.stdout, transfer.FIELDS[name], rows)
+            return
+        with open(output, 'w', newline='', encoding='utf-8') as stream:
+            file_format.write(stream, transfer.FIELDS[name], rows)
+        self.stderr.write(self.style.SUCCESS(f'Выгружено в {output}'))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.synthetic import Generator
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, комментариями и подписками для нагрузочных тестов; '
+            'тот же --seed на пустой базе даёт те же данные')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Сколько авторов в среднем читает пользователь',
+        )
+        parser.add_argument(
+            '--images', type=float, default=0.0,
+            help='Доля постов с картинкой, от 0 до 1',
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='Показатель закона Ципфа для популярности авторов',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней разбросать публикации',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not 0 <= options['images'] <= 1:
+            raise CommandError('--images должно быть от 0 до 1')
+
+        def progress(name, done):
+            self.stdout.write(f'{name}: {done}')
+
+        generator = Generator(
+            seed=options['seed'], alpha=options['alpha'],
+            batch_size=options['batch_size'], progress=progress,
+        )
+        created = generator.generate(
+            users=options['users'], groups=options['groups'],
+            posts=options['posts'], comments=options['comments'],
+            follows=options['follows'], images=options['images'],
+            days=options['days'],
+        )
+        summary = ', '.join(f'{name}: {count}'
+                            for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f'Создано - {summary}'))
+        if created['post'] and options['images']:
+            self.stdout.write(
+                'Картинки постов подготовит команда warm_thumbnails')
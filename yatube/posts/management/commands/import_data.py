@@ -0,0 +1,64 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Загружает группы, посты, комментарии или подписки из JSON Lines '
+            'или CSV пачками bulk_create; прерванный импорт можно '
+            'продолжить с --resume')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=list(transfer.MODELS))
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=list(transfer.FORMATS),
+            help='Формат; по умолчанию по расширению файла, иначе jsonl',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк вставлять одним запросом',
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Продолжить с места, записанного в <path>.progress',
+        )
+        parser.add_argument(
+            '--skip-rebuild', action='store_true',
+            help=('Не пересчитывать счётчики, ленты и поиск: удобно, если '
+                  'следом загружается ещё один файл'),
+        )
+
+    def handle(self, *args, **options):
+        name, path = options['model'], options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        progress_path = path + '.progress'
+        skip = 0
+        if options['resume'] and os.path.exists(progress_path):
+            with open(progress_path) as progress:
+                skip = int(progress.read() or 0)
+            self.stdout.write(f'Продолжаем после строки {skip}')
+
+        def save_progress(done):
+            with open(progress_path, 'w') as progress:
+                progress.write(str(done))
+            self.stdout.write(f'Загружено строк: {done}')
+
+        file_format = transfer.FORMATS[
+            options['format'] or transfer.guess_format(path)]
+        with open(path, newline='', encoding='utf-8') as stream:
+            rows = file_format.read(stream, transfer.FIELDS[name])
+            done = transfer.import_rows(
+                name, rows, options['batch_size'], skip, save_progress)
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        if not options['skip_rebuild']:
+            transfer.finish_import(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершён, строк: {done}'))
+        if name == 'post':
+            self.stdout.write(
+                'Картинки постов подготовит команда warm_thumbnails')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import stats
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает с нуля счётчики постов, комментариев '
+            'и подписок, хранящиеся в моделях')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stats.rebuild()
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
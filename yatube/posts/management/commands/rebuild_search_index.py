@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import caching, search
+
+
+class Command(BaseCommand):
+    help = 'Строит заново полнотекстовый индекс постов'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.rebuild()
+        caching.bump([('posts',)])
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+
+
+class Command(BaseCommand):
+    help = ('Раскладывает по лентам посты знаменитостей, у которых '
+            'подписчиков стало не больше FEED_FANOUT_RESUME, и снова '
+            'включает для них fan-out')
+
+    def handle(self, *args, **options):
+        count = feed.resume_fanout()
+        self.stdout.write(self.style.SUCCESS(
+            f'Авторов возвращено к раскладке по лентам: {count}'))
@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Count, Q
+
+from posts import images
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Заранее готовит варианты картинок постов из '
+            'POST_IMAGE_VARIANTS во всех ширинах и форматах, параллельно '
+            'на всех ядрах')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--jobs', type=int, default=os.cpu_count(),
+            help='Сколько процессов использовать',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать варианты и для уже обработанных постов',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            variants = [spec[0] for spec in images.variant_specs()]
+            posts = posts.annotate(
+                ready=Count('thumbnails', filter=Q(
+                    thumbnails__variant__in=variants)),
+            ).filter(Q(image_ready=False) | Q(ready__lt=len(variants)))
+        pending = list(posts.order_by().values_list('pk', 'image'))
+        if not pending:
+            self.stdout.write('Все картинки уже готовы')
+            return
+        if options['jobs'] > 1:
+            done = self.run_pool(pending, options['jobs'])
+        else:
+            done = sum(images.process(*row) for row in pending)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {done} из {len(pending)}'))
+
+    def run_pool(self, pending, jobs):
+        # Дочерние процессы открывают свои соединения с базой
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(jobs, mp_context=context) as pool:
+            return sum(pool.map(
+                _process, pending,
+                chunksize=max(1, len(pending) // (jobs * 4)),
+            ))
+
+
+def _process(row):
+    post_id, name = row
+    try:
+        return images.process(post_id, name)
+    finally:
+        connections.close_all()
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-18 14:24
+
+from django.db import migrations, models
+
+
+def mark_existing_images_ready(apps, schema_editor):
+    # Старые картинки шаблоны по-прежнему обработают при первом показе
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.exclude(image='').update(image_ready=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_ready',
+            field=models.BooleanField(default=False, editable=False, help_text='Все варианты картинки для шаблонов уже готовы', verbose_name='Картинка обработана'),
+        ),
+        migrations.RunPython(
+            mark_existing_images_ready, migrations.RunPython.noop),
+    ]
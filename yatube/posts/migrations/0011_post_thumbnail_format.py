@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 14:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postthumbnail',
+            name='format',
+            field=models.CharField(blank=True, help_text='Пусто - формат sorl-thumbnail по умолчанию', max_length=8, verbose_name='Формат'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import migrations
+
+# Состояние posts.search на момент миграции: миграция не должна зависеть
+# от того, как этот модуль изменится потом
+SQLITE_TABLE = 'posts_post_fts'
+POSTGRES_INDEX = 'posts_post_text_search'
+
+
+def install_search(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING '
+                f"fts5(text, tokenize='unicode61 remove_diacritics 2')")
+            cursor.execute(f'DELETE FROM {SQLITE_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {SQLITE_TABLE} (rowid, text) '
+                f'SELECT id, text FROM posts_post')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} '
+                f'ON posts_post USING gin ((to_tsvector('
+                f"'{settings.POST_SEARCH_CONFIG}'::regconfig, "
+                f'"posts_post"."text")))')
+
+
+def uninstall_search(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DROP TABLE IF EXISTS {SQLITE_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {POSTGRES_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_thumbnail_format'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 14:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, help_text='Версия закешированной карточки поста', verbose_name='Изменён'),
+        ),
+    ]
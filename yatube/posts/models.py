@@ -1,10 +1,40 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
-class Group(models.Model):
+class AtomicSaveMixin:
+    """Сохраняет строку и обновляет счётчики в сигналах одной транзакцией."""
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class ManagedFieldsMixin:
+    """Не даёт обычному `save()` затереть поля из `managed_fields`.
+
+    Их меняют запросы `UPDATE` в сигналах (`posts.stats`) и в обработке
+    картинок (`posts.images`), так что у загруженного раньше экземпляра
+    значения могут быть устаревшими.
+    Поэтому при изменении строки, если `update_fields` не задан,
+    сохраняются все поля, кроме этих."""
+    managed_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and self.pk is not None
+                and not args and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.managed_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Group(ManagedFieldsMixin, models.Model):
     title = models.CharField(max_length=200,
                              verbose_name='Название группы')
     slug = models.SlugField(unique=True, max_length=50,
@@ -12,12 +42,18 @@ class Group(models.Model):
     description = models.TextField(
         verbose_name='Описание Группы'
     )
+    posts_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Постов в группе'
+    )
+
+    managed_fields = ('posts_count',)
 
     def __str__(self):
         return self.title
 
 
-class Post(models.Model):
+class Post(ManagedFieldsMixin, AtomicSaveMixin, models.Model):
     text = models.TextField(verbose_name='Текст поста',
                             help_text='Текст нового поста')
     pub_date = models.DateTimeField(auto_now_add=True,
@@ -38,15 +74,80 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True,
     )
+    image_ready = models.BooleanField(
+        default=False, editable=False,
+        verbose_name='Картинка обработана',
+        help_text='Все варианты картинки для шаблонов уже готовы'
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Комментариев'
+    )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Изменён',
+        help_text='Версия закешированной карточки поста'
+    )
+
+    managed_fields = ('comments_count', 'image_ready')
 
     def __str__(self) -> str:
         return self.text[:15]
 
+    @property
+    def image_variants(self):
+        """Готовые варианты картинки по имени: `post.image_variants.card`.
+
+        Страницы постов заполняют их заранее (`images.attach_variants`).
+        """
+        if not hasattr(self, '_image_variants'):
+            self._image_variants = {
+                thumb.variant: thumb for thumb in self.thumbnails.all()}
+        return self._image_variants
+
+    def set_image_variants(self, variants):
+        self._image_variants = variants
+
     class Meta:
         ordering = ["-pub_date"]
+        indexes = [
+            models.Index(fields=['-pub_date']),
+            models.Index(fields=['author', '-pub_date']),
+            models.Index(fields=['group', '-pub_date']),
+        ]
+
+
+class PostThumbnail(models.Model):
+    """Заранее подготовленный вариант картинки поста.
+
+    Шаблоны берут адрес отсюда и не обращаются к хранилищу sorl-thumbnail.
+    """
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='thumbnails',
+        verbose_name='Post'
+    )
+    variant = models.CharField(max_length=32, verbose_name='Вариант')
+    url = models.CharField(max_length=255, verbose_name='Адрес')
+    format = models.CharField(
+        max_length=8, blank=True, verbose_name='Формат',
+        help_text='Пусто - формат sorl-thumbnail по умолчанию'
+    )
+    width = models.PositiveIntegerField(verbose_name='Ширина')
+    height = models.PositiveIntegerField(verbose_name='Высота')
+
+    def __str__(self):
+        return f'{self.post_id}:{self.variant}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'variant'], name='unique_post_thumbnail'),
+        ]
 
 
-class Comment(models.Model):
+class Comment(AtomicSaveMixin, models.Model):
     text = models.TextField(verbose_name='Text')
     created = models.DateTimeField(auto_now_add=True,
                                    verbose_name='Created')
@@ -68,9 +169,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['post', '-created']),
+        ]
 
 
-class Follow(models.Model):
+class Follow(AtomicSaveMixin, models.Model):
     user = models.ForeignKey(
         User,
         related_name='follower',
@@ -86,3 +190,64 @@ class Follow(models.Model):
 
     class Meta:
         ordering = ["-user"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='user'
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0, verbose_name='Постов')
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписчиков')
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписок')
+    celebrity = models.BooleanField(
+        default=False, verbose_name='Знаменитость',
+        help_text='Посты не раскладываются по лентам подписчиков, '
+                  'а домешиваются при чтении ленты')
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class FeedEntry(models.Model):
+    """Пост в материализованной ленте подписчика (fan-out on write)."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='user'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Post'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Author'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date']),
+            models.Index(fields=['user', 'author']),
+        ]
@@ -0,0 +1,151 @@
+"""Полнотекстовый поиск по `Post.text`.
+
+Бэкенд выбирается по базе: FTS5 в SQLite, GIN-индекс по `tsvector`
+в PostgreSQL. Для остальных баз - медленный `icontains`.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+WORD = re.compile(r'\w+')
+
+
+class RawSubquery(RawSQL):
+    """`RawSQL` для `pk__in` без собственных скобок: на `IN ((SELECT ...))`
+    SQLite берёт только первую строку подзапроса."""
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+class SqliteSearch:
+    """Отдельная таблица FTS5, `rowid` которой равен `id` поста.
+
+    Таблицу обновляют сигналы `Post`, поэтому она хранит свою копию
+    текста (external content потребовал бы старый текст при правке).
+    """
+    table = 'posts_post_fts'
+
+    def install(self, cursor):
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING '
+            f"fts5(text, tokenize='unicode61 remove_diacritics 2')")
+
+    def uninstall(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def rebuild(self, cursor):
+        cursor.execute(f'DELETE FROM {self.table}')
+        cursor.execute(
+            f'INSERT INTO {self.table} (rowid, text) '
+            f'SELECT id, text FROM posts_post')
+
+    def update(self, cursor, post_id, text, created=False):
+        if not created:
+            self.remove(cursor, post_id)
+        cursor.execute(
+            f'INSERT INTO {self.table} (rowid, text) VALUES (%s, %s)',
+            [post_id, text])
+
+    def remove(self, cursor, post_id):
+        cursor.execute(
+            f'DELETE FROM {self.table} WHERE rowid = %s', [post_id])
+
+    def filter(self, queryset, words):
+        # Каждое слово - префикс: «кот» находит и «котики»
+        match = ' '.join(f'"{word}"*' for word in words)
+        return queryset.filter(pk__in=RawSubquery(
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s',
+            [match]))
+
+
+class PostgresSearch:
+    """Индекс по выражению `to_tsvector(...)`: база обновляет его сама."""
+    index = 'posts_post_text_search'
+
+    @property
+    def vector(self):
+        return (f"to_tsvector('{settings.POST_SEARCH_CONFIG}'::regconfig, "
+                f'"posts_post"."text")')
+
+    def install(self, cursor):
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {self.index} '
+            f'ON posts_post USING gin (({self.vector}))')
+
+    def uninstall(self, cursor):
+        cursor.execute(f'DROP INDEX IF EXISTS {self.index}')
+
+    def rebuild(self, cursor):
+        cursor.execute(f'REINDEX INDEX {self.index}')
+
+    def update(self, cursor, post_id, text, created=False):
+        pass
+
+    def remove(self, cursor, post_id):
+        pass
+
+    def filter(self, queryset, words):
+        query = ' & '.join(f'{word}:*' for word in words)
+        return queryset.filter(pk__in=RawSubquery(
+            f'SELECT id FROM posts_post WHERE {self.vector} @@ to_tsquery('
+            f"'{settings.POST_SEARCH_CONFIG}'::regconfig, %s)",
+            [query]))
+
+
+class ScanSearch:
+    """Без индекса: для баз, у которых нет своего бэкенда."""
+
+    def install(self, cursor):
+        pass
+
+    uninstall = rebuild = install
+
+    def update(self, cursor, post_id, text, created=False):
+        pass
+
+    def remove(self, cursor, post_id):
+        pass
+
+    def filter(self, queryset, words):
+        for word in words:
+            queryset = queryset.filter(text__icontains=word)
+        return queryset
+
+
+BACKENDS = {
+    'sqlite': SqliteSearch,
+    'postgresql': PostgresSearch,
+}
+
+
+def backend(vendor=None):
+    return BACKENDS.get(vendor or connection.vendor, ScanSearch)()
+
+
+def search_posts(queryset, query):
+    """Посты из `queryset`, в тексте которых есть все слова запроса."""
+    words = WORD.findall(query.lower())
+    if not words:
+        return queryset.none()
+    return backend().filter(queryset, words)
+
+
+def index_post(post, created=False):
+    with connection.cursor() as cursor:
+        backend().update(cursor, post.pk, post.text, created)
+
+
+def remove_post(post_id):
+    with connection.cursor() as cursor:
+        backend().remove(cursor, post_id)
+
+
+def rebuild(conn=connection):
+    """Строит индекс заново, например после массового импорта."""
+    search = backend(conn.vendor)
+    with conn.cursor() as cursor:
+        search.install(cursor)
+        search.rebuild(cursor)
@@ -0,0 +1,178 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, counters, feed, images, search, stats
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def follower_feeds(author_id):
+    """Счётчики лент подписчиков обычного автора. У знаменитости их не
+    сбрасываем: её версия входит в `feed.count_scope`."""
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    return [('feed', user_id) for user_id in followers]
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    instance._previous_group_id = None
+    previous_image = ''
+    if instance.pk:
+        instance._previous_group_id, previous_image = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'image').first()
+            or (None, '')
+        )
+    instance._image_changed = (instance.image.name or '') != previous_image
+    if instance._image_changed:
+        instance.image_ready = False
+
+
+@receiver(post_save, sender=Post)
+def process_post_image(sender, instance, created, raw=False, **kwargs):
+    if raw or not instance._image_changed:
+        return
+    if not created:
+        # image_ready не сохраняется вместе с постом (managed_fields)
+        Post.objects.filter(pk=instance.pk).update(image_ready=False)
+    if instance.image:
+        images.enqueue(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust([('all',)], 1)
+        stats.bump_user(instance.author_id, posts_count=1)
+        if instance.group_id:
+            stats.bump_group(instance.group_id, 1)
+        if feed.fan_out(instance):
+            counters.forget(follower_feeds(instance.author_id))
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id != instance.group_id:
+        if previous_group_id:
+            stats.bump_group(previous_group_id, -1)
+        if instance.group_id:
+            stats.bump_group(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.adjust([('all',)], -1)
+    if not feed.is_celebrity(instance.author_id):
+        counters.forget(follower_feeds(instance.author_id))
+    stats.bump_user(instance.author_id, posts_count=-1)
+    if instance.group_id:
+        stats.bump_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        search.index_post(instance, created)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def forget_feed_count(sender, instance, **kwargs):
+    counters.forget([('feed', instance.user_id)])
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        stats.bump_user(instance.user_id, following_count=1)
+        stats.bump_user(instance.author_id, followers_count=1)
+        feed.subscribe(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def count_unfollow(sender, instance, **kwargs):
+    stats.bump_user(instance.user_id, following_count=-1)
+    stats.bump_user(instance.author_id, followers_count=-1)
+    feed.unsubscribe(instance)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        stats.bump_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    stats.bump_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    scopes = caching.post_scopes(instance)
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id != instance.group_id:
+        scopes.append(('group', previous_group_id))
+    caching.bump_on_commit(scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    caching.bump_on_commit([('post', instance.post_id)])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_pages(sender, instance, **kwargs):
+    caching.bump_on_commit([('author', instance.user_id),
+                            ('author', instance.author_id)])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_pages(sender, instance, **kwargs):
+    caching.bump_on_commit([('posts',), ('group', instance.pk), ('groups',)])
+
+
+# Поля пользователя, которые видны на страницах и в карточках постов
+USER_PAGE_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def remember_user_names(sender, instance, update_fields=None, **kwargs):
+    instance._previous_names = None
+    if instance.pk is None or (
+            update_fields is not None
+            and not set(update_fields) & set(USER_PAGE_FIELDS)):
+        return
+    instance._previous_names = (
+        User.objects.filter(pk=instance.pk)
+        .values_list(*USER_PAGE_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=User)
+def invalidate_renamed_user_pages(sender, instance, created, **kwargs):
+    # У нового пользователя ещё нет постов ни на одной странице
+    previous = getattr(instance, '_previous_names', None)
+    if created or previous is None:
+        return
+    current = tuple(getattr(instance, name) for name in USER_PAGE_FIELDS)
+    if current != previous:
+        caching.bump_on_commit([('users',)])
+
+
+@receiver(post_delete, sender=User)
+def invalidate_user_pages(sender, instance, **kwargs):
+    caching.bump_on_commit([('users',)])
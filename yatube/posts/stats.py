@@ -0,0 +1,67 @@
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Group, Post, UserStats
+
+
+def _shift(queryset, **deltas):
+    return queryset.update(**{
+        field: Greatest(F(field) + delta, Value(0))
+        for field, delta in deltas.items()
+    })
+
+
+def bump_user(user_id, **deltas):
+    """Сдвигает счётчики пользователя, создавая строку при первом росте.
+
+    При уменьшении строку не создаём: её может не быть, потому что
+    пользователь удаляется каскадом в этой же транзакции."""
+    shifted = _shift(UserStats.objects.filter(user_id=user_id), **deltas)
+    if not shifted and min(deltas.values()) > 0:
+        UserStats.objects.get_or_create(user_id=user_id)
+        _shift(UserStats.objects.filter(user_id=user_id), **deltas)
+
+
+def bump_group(group_id, delta):
+    _shift(Group.objects.filter(pk=group_id), posts_count=delta)
+
+
+def bump_post(post_id, delta):
+    _shift(Post.objects.filter(pk=post_id), comments_count=delta)
+
+
+def _count_of(model, field, outer='pk'):
+    rows = (
+        model.objects.filter(**{field: OuterRef(outer)})
+        .order_by().values(field)
+        .annotate(total=Count('pk')).values('total')
+    )
+    return Coalesce(Subquery(rows), Value(0))
+
+
+def rebuild(apps=global_apps):
+    """Пересчитывает все денормализованные счётчики с нуля.
+
+    Принимает реестр приложений, чтобы работать и из миграций."""
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        'pk', flat=True)
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in missing.iterator()],
+        batch_size=1000,
+    )
+    Group.objects.update(posts_count=_count_of(Post, 'group'))
+    Post.objects.update(comments_count=_count_of(Comment, 'post'))
+    UserStats.objects.update(
+        posts_count=_count_of(Post, 'author', 'user_id'),
+        followers_count=_count_of(Follow, 'author', 'user_id'),
+        following_count=_count_of(Follow, 'user', 'user_id'),
+    )
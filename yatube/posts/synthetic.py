@@ -0,0 +1,236 @@
+"""Синтетические данные для нагрузочного тестирования.
+
+Всё случайное выводится из одного `seed`, поэтому на пустой базе тот
+же `seed` даёт ту же самую базу (даты отсчитываются от `until`).
+Популярность авторов и групп подчиняется закону Ципфа: у k-го по
+популярности автора в `k ** alpha` раз меньше постов, подписчиков и
+комментариев, чем у первого. Строки пишутся пачками `bulk_create`
+через `transfer`, так что память растёт только со списком постов.
+"""
+import random
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+from PIL import Image, ImageDraw
+
+from . import transfer
+from .models import Comment, Follow, Group, Post, User
+
+LOCALE = 'ru_RU'
+# Сколько разных картинок делят между собой посты с картинками
+IMAGE_POOL = 8
+IMAGE_SIZE = (1200, 800)
+# Доля постов без группы
+NO_GROUP = 0.3
+# Среднее время от публикации поста до комментария, в секундах
+COMMENT_DELAY = 60 * 60 * 24
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def zipf_weights(count, alpha):
+    """Накопленные веса для `random.choices`: k-й весит `1 / k ** alpha`."""
+    return list(accumulate(1 / rank ** alpha for rank in range(1, count + 1)))
+
+
+class Generator:
+    """Генерирует и сохраняет набор данных:
+
+        Generator(seed=1).generate(users=1000, posts=10000)
+
+    `progress(name, done)` вызывается после каждой сохранённой пачки.
+    """
+
+    def __init__(self, seed=0, alpha=1.1, batch_size=1000, progress=None):
+        self.seed = seed
+        self.alpha = alpha
+        self.batch_size = batch_size
+        self.progress = progress
+        self.random = random.Random(seed)
+        self.fake = Faker(LOCALE)
+        self.fake.seed_instance(seed)
+
+    def generate(self, users=1000, groups=20, posts=10000, comments=20000,
+                 follows=20, images=0.0, days=365, until=None):
+        """Создаёт данные и пересчитывает счётчики, ленты и поиск.
+
+        `follows` - сколько авторов в среднем читает пользователь,
+        `images` - доля постов с картинкой. Возвращает число строк по
+        моделям."""
+        until = until or timezone.now()
+        user_ids = self.create_users(users)
+        # Популярность не должна совпадать с порядком регистрации
+        authors = self.random.sample(user_ids, len(user_ids))
+        group_ids = self.save('group', self.group_rows(groups))
+        post_rows = self.post_rows(
+            posts, authors, group_ids, images, until - timedelta(days), until)
+        post_ids = self.save('post', post_rows)
+        comment_ids = self.save('comment', self.comment_rows(
+            comments, authors, user_ids, until))
+        follow_ids = self.save(
+            'follow', self.follow_rows(follows, authors, user_ids))
+        transfer.finish_import('post', 'comment', 'follow')
+        return {
+            'user': len(user_ids),
+            'group': len(group_ids),
+            'post': len(post_ids),
+            'comment': len(comment_ids),
+            'follow': len(follow_ids),
+        }
+
+    def save(self, name, rows):
+        """Сохраняет строки и возвращает их `id`."""
+        ids = []
+
+        def collect(rows):
+            for row in rows:
+                ids.append(row['id'])
+                yield row
+
+        transfer.import_rows(
+            name, collect(rows), self.batch_size,
+            progress=self.progress and (
+                lambda done: self.progress(name, done)),
+        )
+        return ids
+
+    def create_users(self, count):
+        first = next_id(User)
+        # Вход синтетическим пользователям не нужен: клиент тестов
+        # логинится через `force_login`
+        password = make_password(None)
+        users = (
+            User(
+                id=first + n,
+                username=f'{self.fake.user_name()}{first + n}',
+                first_name=self.fake.first_name(),
+                last_name=self.fake.last_name(),
+                password=password,
+            )
+            for n in range(count)
+        )
+        done = 0
+        while True:
+            batch = list(islice(users, self.batch_size))
+            if not batch:
+                break
+            User.objects.bulk_create(batch)
+            done += len(batch)
+            if self.progress:
+                self.progress('user', done)
+        transfer.reset_sequences(User)
+        return list(range(first, first + count))
+
+    def group_rows(self, count):
+        first = next_id(Group)
+        for pk in range(first, first + count):
+            yield {
+                'id': pk,
+                'title': self.fake.sentence(nb_words=3).rstrip('.'),
+                'slug': f'group-{pk}',
+                'description': self.fake.paragraph(),
+            }
+
+    def post_rows(self, count, authors, group_ids, images, since, until):
+        weights = zipf_weights(len(authors), self.alpha)
+        group_weights = zipf_weights(len(group_ids), self.alpha)
+        image_names = self.create_images() if images else []
+        span = (until - since).total_seconds()
+        # Посты с большим `id` новее, как при обычной публикации
+        moments = sorted(self.random.random() for _ in range(count))
+        post_authors = self.random.choices(
+            authors, cum_weights=weights, k=count) if authors else []
+        # Для комментариев: пост, автор и дата каждого созданного поста
+        self.posts = []
+        first = next_id(Post)
+        for n, (author_id, moment) in enumerate(zip(post_authors, moments)):
+            group_id = None
+            if group_ids and self.random.random() >= NO_GROUP:
+                group_id = self.random.choices(
+                    group_ids, cum_weights=group_weights)[0]
+            image = ''
+            if image_names and self.random.random() < images:
+                image = self.random.choice(image_names)
+            pub_date = since + timedelta(seconds=moment * span)
+            self.posts.append((first + n, author_id, pub_date))
+            yield {
+                'id': first + n,
+                'text': self.fake.paragraph(
+                    nb_sentences=self.random.randint(1, 8)),
+                'pub_date': pub_date,
+                'author_id': author_id,
+                'group_id': group_id,
+                'image': image,
+            }
+
+    def create_images(self):
+        """Несколько картинок на все посты: оригиналы разные, чтобы
+        каждой понадобились свои варианты."""
+        names = []
+        for n in range(IMAGE_POOL):
+            name = f'posts/synthetic-{self.seed}-{n}.jpg'
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(self.render_image(n)))
+            names.append(name)
+        return names
+
+    def render_image(self, n):
+        # Свой генератор: есть ли файл на диске, не должно менять данные
+        rng = random.Random(f'{self.seed}-{n}')
+
+        def color():
+            return tuple(rng.randrange(256) for _ in range(3))
+
+        image = Image.new('RGB', IMAGE_SIZE, color())
+        draw = ImageDraw.Draw(image)
+        width, height = IMAGE_SIZE
+        for _ in range(12):
+            x, y = rng.randrange(width), rng.randrange(height)
+            draw.ellipse(
+                (x, y, x + width // 4, y + height // 4), fill=color())
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        return buffer.getvalue()
+
+    def comment_rows(self, count, authors, user_ids, until):
+        """Комментарии чаще достаются постам популярных авторов."""
+        if not self.posts or not user_ids:
+            return
+        rank = {author_id: n for n, author_id in enumerate(authors, 1)}
+        weights = list(accumulate(
+            1 / rank[author_id] ** self.alpha
+            for _, author_id, _ in self.posts))
+        chosen = self.random.choices(self.posts, cum_weights=weights, k=count)
+        first = next_id(Comment)
+        for n, (post_id, _, pub_date) in enumerate(chosen):
+            delay = self.random.expovariate(1 / COMMENT_DELAY)
+            yield {
+                'id': first + n,
+                'text': self.fake.sentence(),
+                'created': min(pub_date + timedelta(seconds=delay), until),
+                'author_id': self.random.choice(user_ids),
+                'post_id': post_id,
+            }
+
+    def follow_rows(self, average, authors, user_ids):
+        """Каждый читает от 0 до `2 * average` авторов, чаще популярных."""
+        if not authors:
+            return
+        weights = zipf_weights(len(authors), self.alpha)
+        pk = next_id(Follow)
+        for user_id in user_ids:
+            picked = self.random.choices(
+                authors, cum_weights=weights,
+                k=self.random.randint(0, 2 * average))
+            for author_id in sorted(set(picked) - {user_id}):
+                yield {'id': pk, 'user_id': user_id, 'author_id': author_id}
+                pk += 1
@@ -0,0 +1,41 @@
+from django import template
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from core.stampede import get_or_compute
+
+from ..caching import card_key, cards_version
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    """Карточка поста из `posts/includes/post_card.html`:
+
+        {% post_card post %}
+
+    Карточка кешируется отдельно для каждого поста. Её версия - поле
+    `post.updated`, поэтому после правки или нового поста заново
+    рендерятся только их карточки. Имена авторов и групп учитываются
+    через `cards_version` из контекста. Карточка видит только `post`,
+    так что ничего личного для пользователя в кеш не попадёт -
+    такие ссылки добавляются в шаблоне после тега. Страницы из
+    `utils.paginator` читают все свои карточки заранее одним `get_many`
+    (`caching.attach_cards`).
+    """
+    version = context.get('cards_version') or cards_version(None)
+    updated = post.updated.isoformat()
+    key = card_key(post.pk, version)
+    prefetched_key, entry = getattr(post, 'cached_card', (None, None))
+    _, html = get_or_compute(
+        key,
+        lambda: (updated, get_template(CARD_TEMPLATE).render({'post': post})),
+        settings.POST_CARD_TIMEOUT,
+        is_valid=lambda value: value[0] == updated, name='post_card',
+        entry=entry if prefetched_key == key else None,
+    )
+    return mark_safe(html)
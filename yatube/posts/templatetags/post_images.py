@@ -0,0 +1,42 @@
+import re
+
+from django import template
+
+register = template.Library()
+
+MIME_TYPES = {
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+}
+DEFAULT_SIZES = '(min-width: 960px) 960px, 100vw'
+
+
+def srcset(thumbs):
+    return ', '.join(f'{thumb.url} {thumb.width}w'
+                     for thumb in sorted(thumbs, key=lambda t: t.width))
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post, name, sizes=DEFAULT_SIZES):
+    """`<picture>` из готовых вариантов картинки поста:
+
+        {% post_picture post "card" %}
+
+    Ширины варианта попадают в `srcset`, дополнительные форматы - в
+    `<source type=...>`, и браузер сам выбирает подходящий файл.
+    """
+    family = re.compile(rf'{re.escape(name)}(-\d+w)?(\.\w+)?')
+    by_format = {}
+    for variant, thumb in post.image_variants.items():
+        if family.fullmatch(variant):
+            by_format.setdefault(thumb.format, []).append(thumb)
+    return {
+        'image': post.image_variants.get(name),
+        'srcset': srcset(by_format.pop('', [])),
+        'sizes': sizes,
+        'sources': [
+            {'type': MIME_TYPES.get(fmt, f'image/{fmt.lower()}'),
+             'srcset': srcset(thumbs)}
+            for fmt, thumbs in by_format.items()
+        ],
+    }
@@ -0,0 +1,61 @@
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Group, Post, User
+
+
+class PostAdminTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='slug_slug',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:posts_post_changelist')
+
+    def create_posts(self, count):
+        for i in range(count):
+            Post.objects.create(
+                text=f'Пост {i}', author=self.admin, group=self.group)
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """Число запросов списка постов не зависит от числа строк"""
+        self.create_posts(2)
+        few = self.changelist_queries()
+        self.create_posts(8)
+        self.assertEqual(self.changelist_queries(), few)
+
+    @override_settings(EXACT_COUNT_LIMIT=0)
+    def test_unfiltered_count_is_estimated(self):
+        """Без фильтров число постов оценивается, с фильтром - точное"""
+        self.create_posts(3)
+        Post.objects.order_by('pk')[1].delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get(self.url, {'q': 'Пост'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_group_autocomplete(self):
+        """Группа выбирается через автодополнение по названию"""
+        response = self.client.get(
+            reverse('admin:posts_group_autocomplete'), {'term': 'Тест'},
+            HTTP_REFERER=self.url)
+        results = response.json()['results']
+        self.assertEqual(
+            [item['text'] for item in results], [self.group.title])
@@ -0,0 +1,51 @@
+from django.test import TestCase, override_settings
+
+from .. import benchmark
+from ..synthetic import Generator
+from ..urls import urlpatterns
+
+
+class PercentileTest(TestCase):
+    def test_percentile_interpolates(self):
+        """Перцентили считаются с линейной интерполяцией"""
+        values = [4, 1, 3, 2]
+        self.assertEqual(benchmark.percentile(values, 0), 1)
+        self.assertEqual(benchmark.percentile(values, 50), 2.5)
+        self.assertEqual(benchmark.percentile(values, 100), 4)
+        self.assertEqual(benchmark.percentile([7], 99), 7)
+
+
+@override_settings(QUERY_STATS_HEADERS=True)
+class BenchmarkRunTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Generator(seed=1).generate(
+            users=15, groups=3, posts=60, comments=60, follows=3)
+
+    def test_every_route_has_scenario(self):
+        """Замер покрывает каждый маршрут `posts.urls`"""
+        names = {pattern.name for pattern in urlpatterns}
+        reader = benchmark.choose_reader()
+        self.assertEqual(set(benchmark.scenarios(reader)), names)
+
+    def test_run_reports_every_route(self):
+        """Каждый маршрут отвечает без ошибок, запросы посчитаны"""
+        results = benchmark.run(
+            benchmark.ClientTransport(), iterations=3, warmup=1)
+        self.assertEqual(len(results), len(urlpatterns))
+        for name, stats in results.items():
+            with self.subTest(route=name):
+                self.assertEqual(stats['errors'], 0)
+                self.assertGreater(stats['queries_per_request'], 0)
+                self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+
+    def test_compare_matches_routes_by_size(self):
+        """Сравнение сопоставляет маршруты одного размера набора"""
+        routes = benchmark.run(
+            benchmark.ClientTransport(), iterations=2, routes=['index'])
+        report = {'sizes': [{'posts': 60, 'routes': routes}]}
+        other = {'sizes': [{'posts': 100, 'routes': routes}]}
+        rows = benchmark.compare(report, report)
+        self.assertEqual([(route, posts) for route, posts, _ in rows],
+                         [('index', 60)])
+        self.assertEqual(benchmark.compare(other, report), [])
@@ -1,13 +1,28 @@
 import tempfile
+from io import BytesIO, StringIO
 import shutil
+from unittest import mock
+import PIL.Image
 from django.conf import settings
+from django.template import Context, Template
 from django.test import Client, TestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django.core.cache import cache
-from ..models import Group, Post, User, Comment
+from django.core.management import call_command
+from .. import images
+from ..forms import GroupAutocompleteSelect, PostForm
+from ..models import Group, Post, PostThumbnail, User, Comment
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -124,3 +139,262 @@ class TaskPagesTests(TestCase):
         self.assertEqual(last_comment.author, self.user)
         self.assertEqual(last_comment.post_id, post_id)
         self.assertRedirects(comment, comment_on_page)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImagePipelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, name):
+        return SimpleUploadedFile(
+            name=name, content=SMALL_GIF, content_type='image/gif')
+
+    def test_placeholder_until_variants_ready(self):
+        """Пока картинка в очереди, страницы показывают заглушку"""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': self.upload('a.gif')},
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertFalse(post.image_ready)
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(response, 'Картинка обрабатывается')
+        self.assertNotContains(response, '<img class="card-img')
+
+        images.process(post.pk, post.image.name)
+
+        post.refresh_from_db()
+        self.assertTrue(post.image_ready)
+        card = post.thumbnails.get(variant='card')
+        self.assertEqual((card.width, card.height), (960, 339))
+        response = Client().get(reverse('posts:index'))
+        self.assertNotContains(response, 'Картинка обрабатывается')
+        small = post.thumbnails.get(variant='card-480w')
+        self.assertEqual((small.width, small.height), (480, 170))
+        self.assertContains(response, f'src="{card.url}"')
+        self.assertContains(response, f'{small.url} 480w, {card.url} 960w')
+
+    def test_new_image_resets_ready_flag(self):
+        """Замена картинки снова отправляет пост в обработку"""
+        post = Post.objects.create(
+            text='Пост', author=self.user, image=self.upload('b.gif'))
+        images.process(post.pk, post.image.name)
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Пост', 'image': self.upload('c.gif')},
+        )
+        post.refresh_from_db()
+        self.assertFalse(post.image_ready)
+
+    def test_edit_keeps_ready_flag_set_meanwhile(self):
+        """Правка, начатая до готовности вариантов, не сбрасывает флаг"""
+        post = Post.objects.create(
+            text='Пост', author=self.user, image=self.upload('f.gif'))
+        stale = Post.objects.get(pk=post.pk)
+        images.process(post.pk, post.image.name)
+        stale.text = 'Правка'
+        stale.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Правка')
+        self.assertTrue(post.image_ready)
+
+    def test_stale_job_is_ignored(self):
+        """Задача для заменённой картинки не отмечает пост готовым"""
+        post = Post.objects.create(
+            text='Пост', author=self.user, image=self.upload('d.gif'))
+        images.process(post.pk, 'posts/old.gif')
+        post.refresh_from_db()
+        self.assertFalse(post.image_ready)
+
+    def test_warm_thumbnails_command(self):
+        """Команда готовит недостающие варианты и не трогает готовые"""
+        post = Post.objects.create(
+            text='Пост', author=self.user, image=self.upload('e.gif'))
+        Post.objects.create(text='Без картинки', author=self.user)
+
+        call_command('warm_thumbnails', jobs=1, stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertTrue(post.image_ready)
+        self.assertEqual(
+            PostThumbnail.objects.count(), len(images.variant_specs()))
+        card = PostThumbnail.objects.get(variant='card')
+        call_command('warm_thumbnails', jobs=1, stdout=StringIO())
+        self.assertEqual(PostThumbnail.objects.get(variant='card').pk, card.pk)
+
+    @mock.patch.object(images, 'extra_formats', return_value=['WEBP'])
+    def test_modern_formats_go_to_picture_sources(self, _):
+        """Дополнительные форматы попадают в <source> тега <picture>"""
+        specs = {spec[0]: spec for spec in images.variant_specs()}
+        self.assertEqual(specs['card-480w.webp'][2]['format'], 'WEBP')
+        post = Post.objects.create(text='Пост', author=self.user)
+        post.set_image_variants({
+            variant: PostThumbnail(
+                variant=variant, url=f'/{variant}', format=fmt,
+                width=int(geometry.split('x')[0]), height=1)
+            for variant, geometry, _, fmt in specs.values()
+        })
+        html = Template(
+            '{% load post_images %}{% post_picture post "card" %}'
+        ).render(Context({'post': post}))
+        self.assertIn(
+            '<source type="image/webp" srcset="/card-480w.webp 480w, '
+            '/card.webp 960w, /card-1440w.webp 1440w"', html)
+        self.assertIn('src="/card" srcset="/card-480w 480w', html)
+
+    def test_page_variants_are_read_in_one_batch(self):
+        """Варианты картинок страницы читаются из кеша без запросов"""
+        for name in ('f.gif', 'g.gif'):
+            post = Post.objects.create(
+                text='Пост', author=self.user, image=self.upload(name))
+            images.process(post.pk, post.image.name)
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(1):
+            images.attach_variants(posts)
+        with self.assertNumQueries(0):
+            images.attach_variants(posts)
+        for post in posts:
+            self.assertEqual(
+                post.image_variants['card'].url,
+                post.thumbnails.get(variant='card').url)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class UploadLimitsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, size, fmt='PNG'):
+        content = BytesIO()
+        PIL.Image.new('RGB', size, (200, 0, 0)).save(content, fmt)
+        return SimpleUploadedFile(
+            name=f'photo.{fmt.lower()}', content=content.getvalue(),
+            content_type=f'image/{fmt.lower()}')
+
+    def create(self, image):
+        return self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': image},
+        )
+
+    @override_settings(UPLOAD_MAX_SIZE=100)
+    def test_oversized_file_is_rejected(self):
+        """Слишком большой файл отклоняется с понятной ошибкой"""
+        response = self.create(self.upload((50, 50)))
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше допустимых 100\xa0байт')
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(UPLOAD_MAX_PIXELS=1000)
+    def test_too_many_pixels_is_rejected(self):
+        """Картинка отклоняется по размерам из заголовка"""
+        response = self.create(self.upload((50, 50)))
+        self.assertFormError(
+            response, 'form', 'image',
+            'Картинка 50x50 слишком большая, допустимо до 1000 пикселей')
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_original_is_downscaled(self):
+        """Оригинал уменьшается до POST_IMAGE_MAX_SIDE по длинной стороне"""
+        self.create(self.upload((400, 200), 'JPEG'))
+        post = Post.objects.get()
+        with PIL.Image.open(post.image) as image:
+            self.assertEqual(image.size, (100, 50))
+            self.assertEqual(image.format, 'JPEG')
+
+    def test_small_original_is_kept(self):
+        """Небольшая картинка сохраняется без изменений"""
+        upload = self.upload((60, 30))
+        content = upload.read()
+        upload.seek(0)
+        self.create(upload)
+        post = Post.objects.get()
+        self.assertEqual(post.image.read(), content)
+
+
+class GroupChoicesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='slug_slug',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_choices_come_from_cache(self):
+        """Форма поста не читает группы из базы при каждом показе"""
+        PostForm()
+        with self.assertNumQueries(0):
+            form = PostForm()
+        self.assertEqual(
+            list(form.fields['group'].choices),
+            [(self.group.pk, self.group.title)])
+
+    def test_group_changes_reset_choices(self):
+        """Изменение групп сразу видно в форме"""
+        PostForm()
+        group = Group.objects.create(
+            title='Новая группа', slug='new', description='Описание')
+        self.assertIn(
+            (group.pk, group.title), PostForm().fields['group'].choices)
+        group.delete()
+        self.assertNotIn(
+            (group.pk, group.title), PostForm().fields['group'].choices)
+
+    @override_settings(GROUP_CHOICES_LIMIT=1)
+    def test_many_groups_use_autocomplete(self):
+        """При большом числе групп они подгружаются по мере ввода"""
+        other = Group.objects.create(
+            title='Другая группа', slug='other', description='Описание')
+        form = PostForm()
+        self.assertIsInstance(
+            form.fields['group'].widget, GroupAutocompleteSelect)
+        self.assertNotIn(self.group.title, form.as_p())
+
+        response = self.authorized_client.get(
+            reverse('posts:group_autocomplete'), {'term': 'друг'})
+        self.assertEqual(
+            response.json(),
+            {'results': [{'id': other.pk, 'text': other.title}]})
+
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост в группе', 'group': other.pk},
+        )
+        post = Post.objects.get(text='Пост в группе')
+        self.assertEqual(post.group, other)
+        response = self.authorized_client.get(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}))
+        self.assertContains(
+            response, f'<option value="{other.pk}" selected>')
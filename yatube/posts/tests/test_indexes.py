@@ -0,0 +1,69 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+# Полный проход по таблице без индекса: `SCAN posts_post` (или
+# `SCAN TABLE posts_post` в старых SQLite), но не `SCAN ... USING INDEX`.
+TABLE_SCAN = re.compile(r'^SCAN (?:TABLE )?(posts_\w+)$')
+
+
+class ListingIndexesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='slug_slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый пост', author=cls.author, group=cls.group)
+        Comment.objects.create(
+            text='Комментарий', author=cls.reader, post=cls.post)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def table_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = [row[-1] for row in cursor.fetchall()]
+        return [step for step in plan if TABLE_SCAN.match(step)]
+
+    def test_view_queries_use_indexes(self):
+        """Запросы представлений posts не сканируют таблицы целиком"""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(url)
+                for query in queries:
+                    if not query['sql'].startswith('SELECT'):
+                        continue
+                    self.assertEqual(
+                        self.table_scans(query['sql']), [], query['sql'])
+
+    def test_follow_pair_is_unique(self):
+        """Повторная подписка на автора не создаёт дубликат"""
+        self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'author'}))
+        self.assertEqual(
+            Follow.objects.filter(user=self.reader, author=self.author)
+            .count(), 1)
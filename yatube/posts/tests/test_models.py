@@ -1,5 +1,8 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
-from ..models import Group, Post, User
+from ..models import Comment, Follow, Group, Post, User, UserStats
 
 
 class PostGroupModelTest(TestCase):
@@ -61,3 +64,79 @@ class PostGroupModelTest(TestCase):
             with self.subTest(value=value):
                 verbose_name = self.group._meta.get_field(value).verbose_name
                 self.assertEqual(verbose_name, expected)
+
+
+class DenormalizedCountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slugs',
+            description='Тестовое описание',
+        )
+
+    def test_counters_follow_created_and_deleted_rows(self):
+        """Счётчики в моделях меняются вместе со строками."""
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group)
+        comment = Comment.objects.create(
+            author=self.reader, post=post, text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.group.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1)
+
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 0)
+        post.delete()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 0)
+
+    def test_stale_instance_save_keeps_counters(self):
+        """Сохранение загруженного раньше экземпляра не затирает счётчики"""
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group)
+        stale_post = Post.objects.get(pk=post.pk)
+        stale_group = Group.objects.get(pk=self.group.pk)
+        Comment.objects.create(
+            author=self.reader, post=post, text='Комментарий')
+        Post.objects.create(author=self.author, text='Ещё', group=self.group)
+        stale_post.text = 'Правка'
+        stale_post.save()
+        stale_group.title = 'Новое название'
+        stale_group.save()
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.text, 'Правка')
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.title, 'Новое название')
+        self.assertEqual(self.group.posts_count, 2)
+
+    def test_rebuild_counters_command(self):
+        """Команда rebuild_counters пересчитывает счётчики с нуля."""
+        Post.objects.create(author=self.author, text='Пост', group=self.group)
+        Group.objects.update(posts_count=0)
+        UserStats.objects.all().delete()
+        call_command('rebuild_counters', stdout=StringIO())
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).posts_count, 0)
@@ -0,0 +1,93 @@
+import shutil
+import tempfile
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..models import Comment, FeedEntry, Follow, Group, Post, User, UserStats
+from ..synthetic import Generator
+
+UNTIL = datetime(2024, 1, 1, tzinfo=timezone.utc)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SIZES = dict(users=40, groups=4, posts=300, comments=200, follows=3,
+             until=UNTIL)
+
+
+def snapshot():
+    return (
+        list(User.objects.order_by('pk').values_list('pk', 'username')),
+        list(Group.objects.order_by('pk').values_list('pk', 'title')),
+        list(Post.objects.order_by('pk').values_list(
+            'pk', 'text', 'pub_date', 'author_id', 'group_id')),
+        list(Comment.objects.order_by('pk').values_list(
+            'pk', 'created', 'author_id', 'post_id')),
+        list(Follow.objects.order_by('pk').values_list(
+            'user_id', 'author_id')),
+    )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GeneratorTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_same_seed_same_data(self):
+        """Один seed на пустой базе даёт одни и те же данные"""
+        Generator(seed=7, batch_size=50).generate(**SIZES)
+        first = snapshot()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        Generator(seed=7, batch_size=50).generate(**SIZES)
+        self.assertEqual(snapshot(), first)
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        Generator(seed=8, batch_size=50).generate(**SIZES)
+        self.assertNotEqual(snapshot()[2], first[2])
+
+    def test_counts_and_power_law(self):
+        """Создаётся заказанное число строк, популярность по Ципфу"""
+        created = Generator(seed=1, batch_size=50).generate(**SIZES)
+        self.assertEqual(created['post'], Post.objects.count())
+        self.assertEqual(created['follow'], Follow.objects.count())
+        self.assertEqual(
+            (created['user'], created['group'], created['comment']),
+            (40, 4, 200))
+        per_author = sorted(Counter(
+            Post.objects.values_list('author_id', flat=True)).values())
+        median = per_author[len(per_author) // 2]
+        self.assertGreater(per_author[-1], 5 * median)
+        pub_dates = list(Post.objects.order_by('pk').values_list(
+            'pub_date', flat=True))
+        self.assertEqual(pub_dates, sorted(pub_dates))
+        self.assertLessEqual(pub_dates[-1], UNTIL)
+        self.assertFalse(
+            Comment.objects.filter(created__gt=UNTIL).exists())
+
+    def test_counters_and_feeds_rebuilt(self):
+        """Счётчики и ленты пересчитаны, как после обычных сохранений"""
+        Generator(seed=1, batch_size=50).generate(**SIZES)
+        follow = Follow.objects.first()
+        self.assertEqual(
+            UserStats.objects.get(user_id=follow.author_id).followers_count,
+            Follow.objects.filter(author_id=follow.author_id).count())
+        self.assertEqual(
+            FeedEntry.objects.filter(user_id=follow.user_id,
+                                     author_id=follow.author_id).count(),
+            Post.objects.filter(author_id=follow.author_id).count())
+        post = Post.objects.order_by('-comments_count').first()
+        self.assertEqual(post.comments_count, post.comments.count())
+
+    def test_images(self):
+        """Доля постов получает картинки из общего набора файлов"""
+        Generator(seed=1).generate(**dict(SIZES, images=0.5))
+        names = set(Post.objects.exclude(image='').values_list(
+            'image', flat=True))
+        self.assertTrue(names)
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+        self.assertFalse(Post.objects.filter(image_ready=True).exists())
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+
+from .. import search, transfer
+from ..models import (Comment, FeedEntry, Follow, Group, Post, User,
+                      UserStats)
+
+TEMP_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class TransferTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='slug_slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            text='Пост, с запятой', author=cls.author, group=cls.group)
+        cls.lonely = Post.objects.create(text='Без группы', author=cls.author)
+        Comment.objects.create(
+            text='Комментарий', author=cls.reader, post=cls.post)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def export(self, name, extension):
+        path = os.path.join(TEMP_DIR, f'{name}.{extension}')
+        call_command('export_data', name, output=path,
+                     chunk_size=1, stderr=StringIO())
+        return path
+
+    def round_trip(self, extension):
+        paths = {name: self.export(name, extension)
+                 for name in ('group', 'post', 'comment', 'follow')}
+        pub_dates = dict(Post.objects.values_list('pk', 'pub_date'))
+        Group.objects.all().delete()
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        for name, path in paths.items():
+            call_command('import_data', name, path,
+                         batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            dict(Post.objects.values_list('pk', 'pub_date')), pub_dates)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, self.post.text)
+        self.assertEqual(post.group_id, self.group.pk)
+        self.assertIsNone(Post.objects.get(pk=self.lonely.pk).group_id)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 1)
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 2)
+        self.assertEqual(
+            set(search.search_posts(Post.objects.all(), 'запятой')), {post})
+
+    def test_jsonl_round_trip(self):
+        """Выгрузка и загрузка JSON Lines сохраняют данные и даты"""
+        self.round_trip('jsonl')
+
+    def test_csv_round_trip(self):
+        """Выгрузка и загрузка CSV сохраняют данные и пустые ссылки"""
+        self.round_trip('csv')
+
+    def test_import_resumes_from_progress(self):
+        """--resume продолжает импорт с записанной строки"""
+        path = self.export('group', 'jsonl')
+        with open(path, 'a', encoding='utf-8') as stream:
+            stream.write('{"title": "Новая", "slug": "new", '
+                         '"description": "-"}\n')
+        with open(path + '.progress', 'w') as progress:
+            progress.write('1')
+        call_command('import_data', 'group', path, resume=True,
+                     stdout=StringIO())
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertFalse(os.path.exists(path + '.progress'))
+
+    def test_import_is_idempotent(self):
+        """Повторный импорт тех же строк не создаёт дубликатов"""
+        path = self.export('follow', 'csv')
+        rows = transfer.FORMATS['csv'].read(open(path), ())
+        transfer.import_rows('follow', rows, batch_size=10)
+        self.assertEqual(Follow.objects.count(), 1)
@@ -1,6 +1,7 @@
 from http import HTTPStatus
 from django.shortcuts import get_object_or_404
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
 
 from posts.models import Group, Post, User, Follow
 
@@ -109,3 +110,17 @@ class PostURLTest(TestCase):
         """Проверка, что вернется код 404 при открытии несуществ. страницы"""
         response = self.guest_client.get('/any_page')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    @override_settings(QUERY_STATS_HEADERS=True)
+    def test_query_stats_headers(self):
+        """С QUERY_STATS_HEADERS ответ содержит число и время SQL-запросов"""
+        cache.clear()
+        response = self.guest_client.get('/')
+        self.assertGreater(int(response['X-DB-Query-Count']), 0)
+        self.assertIn('X-DB-Time-Ms', response)
+
+    @override_settings(QUERY_STATS_HEADERS=False)
+    def test_query_stats_headers_hidden(self):
+        """Без QUERY_STATS_HEADERS статистика в заголовки не попадает"""
+        response = self.guest_client.get('/')
+        self.assertNotIn('X-DB-Query-Count', response)
@@ -1,13 +1,22 @@
 import tempfile
 import shutil
-from django.test import Client, TestCase, override_settings
+from io import StringIO
+from unittest import mock
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings)
 from django.urls import reverse
 from django import forms
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Group, Post, User, Follow
+from core.stampede import get_or_compute
+
+from .. import caching, counters, feed
+from ..models import Comment, FeedEntry, Group, Post, User, Follow
 
 COUNT_POSTS: int = 13
 FIRS_PAGE_COUNT_POSTS: int = 10
@@ -118,6 +127,20 @@ class TaskPagesTests(TestCase):
         self.cheking_post(test_post_object=test_post_object)
         self.assertEqual(test_post_object, response.context['first_post'])
 
+    def test_profile_and_detail_skip_aggregate_queries(self):
+        """profile и post_detail берут счётчики из моделей, без COUNT(*)"""
+        urls = [
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.authorized_client.get(url)
+                self.assertFalse(
+                    [q for q in queries if 'COUNT(' in q['sql'].upper()])
+        self.assertEqual(response.context['count'], 1)
+
     def test_post_detail_page_show_correct_context(self):
         """Проверка на то,чтошаблон post_detail сф. с правильным контекстом"""
         response = self.authorized_client.get(
@@ -232,6 +255,138 @@ class PaginatorViewsTest(TestCase):
                     SECOND_PAGE_COUNT_POSTS)
 
 
+@override_settings(CURSOR_PAGINATION=True)
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='auth')
+        for i in range(COUNT_POSTS):
+            Post.objects.create(text=f'Пост num{i}', author=cls.user)
+
+    def setUp(self):
+        self.unauthorized_client = Client()
+        cache.clear()
+
+    def test_cursor_pages_walk_forward_and_back(self):
+        """Проверка keyset-пагинации по токену ?cursor="""
+        first = self.unauthorized_client.get(
+            reverse('posts:index')).context['page_obj']
+        self.assertEqual(len(first), FIRS_PAGE_COUNT_POSTS)
+        self.assertTrue(first.has_next())
+        self.assertFalse(first.has_previous())
+
+        second = self.unauthorized_client.get(
+            reverse('posts:index'),
+            {'cursor': first.next_cursor}).context['page_obj']
+        self.assertEqual(len(second), SECOND_PAGE_COUNT_POSTS)
+        self.assertFalse(second.has_next())
+        self.assertTrue(second.has_previous())
+        self.assertFalse(set(first) & set(second))
+
+        back = self.unauthorized_client.get(
+            reverse('posts:index'),
+            {'cursor': second.previous_cursor}).context['page_obj']
+        self.assertEqual(list(back), list(first))
+
+    def test_cursor_pagination_does_not_count(self):
+        """Страница по курсору не выполняет COUNT(*)"""
+        first = self.unauthorized_client.get(
+            reverse('posts:index')).context['page_obj']
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.unauthorized_client.get(
+                reverse('posts:index'), {'cursor': first.next_cursor})
+        self.assertNotIn(b'?page=', response.content)
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый токен открывает первую страницу"""
+        response = self.unauthorized_client.get(
+            reverse('posts:index'), {'cursor': 'broken'})
+        self.assertEqual(
+            len(response.context['page_obj']), FIRS_PAGE_COUNT_POSTS)
+
+
+class PostCountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='slug_slug',
+            description='Тестовое описание',
+        )
+        for i in range(COUNT_POSTS):
+            Post.objects.create(
+                text=f'Пост num{i}', author=cls.user, group=cls.group)
+
+    def setUp(self):
+        self.unauthorized_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def test_page_range_uses_cached_count(self):
+        """Повторная страница берёт число постов из кеша, без COUNT(*)"""
+        url = reverse('posts:index')
+        self.authorized_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            page_obj = self.authorized_client.get(
+                url).context['page_obj']
+        self.assertFalse(
+            [q for q in queries if 'COUNT(' in q['sql'].upper()])
+        self.assertEqual(page_obj.paginator.count, COUNT_POSTS)
+
+    def test_counts_follow_post_signals(self):
+        """Счётчики сдвигаются при создании и удалении поста"""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.unauthorized_client.get(url)
+        self.unauthorized_client.get(reverse('posts:index'))
+        post = Post.objects.create(
+            text='Новый', author=self.user, group=self.group)
+        page_obj = self.unauthorized_client.get(url).context['page_obj']
+        self.assertEqual(page_obj.paginator.count, COUNT_POSTS + 1)
+        post.group = None
+        post.save()
+        page_obj = self.unauthorized_client.get(url).context['page_obj']
+        self.assertEqual(page_obj.paginator.count, COUNT_POSTS)
+        post.delete()
+        page_obj = self.unauthorized_client.get(
+            reverse('posts:index')).context['page_obj']
+        self.assertEqual(page_obj.paginator.count, COUNT_POSTS)
+
+
+class PostCountersCommitTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        Post.objects.create(text='Первый', author=self.user)
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def count(self):
+        return Client().get(
+            reverse('posts:index')).context['page_obj'].paginator.count
+
+    def test_count_adjusted_after_commit(self):
+        """Счётчик сдвигается после коммита, откат его не трогает"""
+        self.assertEqual(self.count(), 1)
+        try:
+            with transaction.atomic():
+                Post.objects.create(text='Откатится', author=self.user)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(cache.get(counters.scope_key('all')), 1)
+        with transaction.atomic():
+            Post.objects.create(text='Второй', author=self.user)
+            self.assertEqual(cache.get(counters.scope_key('all')), 1)
+        self.assertEqual(cache.get(counters.scope_key('all')), 2)
+        self.assertEqual(self.count(), 2)
+
+
 class CacheTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -247,18 +402,163 @@ class CacheTest(TestCase):
 
     def test_cache_work(self):
         """Тестирование работы кеша"""
-        new_post = Post.objects.create(
+        Post.objects.create(
             text='Текст',
             author=self.user,
         )
-        # print(Post.objects.all())
         content_after_push = self.guest_client.get(
             reverse('posts:index')).content
+        with self.assertNumQueries(0):
+            content_cached = self.guest_client.get(
+                reverse('posts:index')).content
+        self.assertEqual(content_after_push, content_cached)
+
+    def test_cache_invalidated_by_signals(self):
+        """Изменения постов и комментариев сбрасывают кеш страниц"""
+        new_post = Post.objects.create(
+            text='Текст',
+            author=self.user,
+        )
+        detail_url = reverse('posts:post_detail',
+                             kwargs={'post_id': new_post.id})
+        self.guest_client.get(detail_url)
+        Comment.objects.create(
+            text='Новый комментарий', author=self.user, post=new_post)
+        self.assertContains(
+            self.guest_client.get(detail_url), 'Новый комментарий')
+
+        self.guest_client.get(reverse('posts:index'))
         new_post.delete()
-        # print(Post.objects.all())
         content_after_delete = self.guest_client.get(
             reverse('posts:index')).content
-        self.assertEqual(content_after_push, content_after_delete)
+        self.assertNotIn('Текст'.encode(), content_after_delete)
+
+    def test_authorized_user_bypasses_page_cache(self):
+        """Авторизованные пользователи не получают страницы из кеша"""
+        client = Client()
+        client.force_login(self.user)
+        client.get(reverse('posts:index'))
+        response = client.get(reverse('posts:index'))
+        self.assertIsNotNone(response.context)
+
+
+class CacheCommitTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_pages_invalidated_after_commit(self):
+        """Версия страниц сдвигается ещё раз, когда транзакция закрыта"""
+        key = caching.version_key('posts')
+        with transaction.atomic():
+            Post.objects.create(text='Текст', author=self.user)
+            inside = cache.get(key)
+            self.assertIsNotNone(inside)
+        self.assertNotEqual(cache.get(key), inside)
+
+    def test_rollback_keeps_single_bump(self):
+        """После отката отложенный сдвиг версии не выполняется"""
+        key = caching.version_key('posts')
+        try:
+            with transaction.atomic():
+                Post.objects.create(text='Текст', author=self.user)
+                inside = cache.get(key)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(cache.get(key), inside)
+        self.assertFalse(Post.objects.exists())
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(3):
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.user, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.url = reverse('posts:profile', args=[self.user.username])
+
+    def card_renders(self):
+        response = self.client.get(self.url)
+        totals = response.wsgi_request.template_timings.totals
+        count, _ = totals.get('posts/includes/post_card.html', (0, 0))
+        return response, count
+
+    def test_only_new_post_card_is_rendered(self):
+        """Новый пост рендерит одну карточку, остальные из кеша"""
+        self.assertEqual(self.card_renders()[1], 3)
+        self.assertEqual(self.card_renders()[1], 0)
+        Post.objects.create(text='Свежий пост', author=self.user)
+        response, count = self.card_renders()
+        self.assertEqual(count, 1)
+        self.assertContains(response, 'Свежий пост')
+
+    def test_card_follows_post_version(self):
+        """Карточка меняется вместе с `updated` поста"""
+        self.card_renders()
+        post = Post.objects.get(text='Пост 0')
+        Post.objects.filter(pk=post.pk).update(text='Тихая правка')
+        self.assertNotContains(self.card_renders()[0], 'Тихая правка')
+        post.text = 'Правка'
+        post.save()
+        response, count = self.card_renders()
+        self.assertEqual(count, 1)
+        self.assertContains(response, 'Правка')
+
+    def test_author_and_group_changes_refresh_cards(self):
+        """Смена имени автора или названия группы обновляет карточки"""
+        self.card_renders()
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Лев'
+        user.save()
+        response, count = self.card_renders()
+        self.assertEqual(count, 3)
+        self.assertContains(response, 'Лев')
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новое название'
+        group.save()
+        self.assertContains(self.card_renders()[0], 'Новое название')
+
+    def test_page_reads_cards_with_one_get_many(self):
+        """Карточки страницы читаются из кеша одним get_many"""
+        self.card_renders()
+        with mock.patch.object(
+                cache, 'get_many', wraps=cache.get_many) as many, \
+                mock.patch('posts.templatetags.post_cards.get_or_compute',
+                           wraps=get_or_compute) as compute:
+            self.assertEqual(self.card_renders()[1], 0)
+        card_batches = [call[0][0] for call in many.call_args_list
+                        if call[0][0][0].startswith('posts:card')]
+        self.assertEqual(len(card_batches), 1)
+        self.assertEqual(len(card_batches[0]), 3)
+        self.assertEqual(compute.call_count, 3)
+        for call in compute.call_args_list:
+            self.assertIsNotNone(call[1]['entry'])
+
+    def test_signup_and_password_keep_cards(self):
+        """Регистрация и смена пароля не сбрасывают кеш карточек"""
+        self.card_renders()
+        User.objects.create_user(username='newcomer')
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password('new-password')
+        user.save()
+        self.client.force_login(user)
+        self.assertEqual(self.card_renders()[1], 0)
 
 
 class FollowingTest(TestCase):
@@ -328,3 +628,181 @@ class FollowingTest(TestCase):
         # Новая запись не появляется в ленте тех, кто не подписан
         response = self.authorized_author.get(reverse('posts:follow_index'))
         self.assertEqual(len(response.context['page_obj']), 0)
+
+
+class FeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.old_post = Post.objects.create(text='Старый', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_follower = Client()
+        self.authorized_follower.force_login(self.follower)
+
+    def feed_posts(self):
+        response = self.authorized_follower.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_feed_is_materialized_on_write(self):
+        """Подписка и новые посты раскладываются в FeedEntry"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        new_post = Post.objects.create(text='Новый', author=self.author)
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.follower).count(), 2)
+        self.assertEqual(self.feed_posts(), [new_post, self.old_post])
+
+        Follow.objects.filter(
+            user=self.follower, author=self.author).delete()
+        self.assertFalse(FeedEntry.objects.filter(user=self.follower))
+        self.assertEqual(self.feed_posts(), [])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_celebrity_posts_are_read_on_demand(self):
+        """Посты авторов с множеством подписчиков читаются при чтении"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        new_post = Post.objects.create(text='Новый', author=self.author)
+        self.assertFalse(FeedEntry.objects.filter(user=self.follower))
+        self.assertEqual(self.feed_posts(), [new_post, self.old_post])
+
+    @override_settings(FEED_FANOUT_LIMIT=0, CURSOR_PAGINATION=False)
+    def test_celebrity_post_changes_feed_count_scope(self):
+        """Пост знаменитости не трогает счётчики лент подписчиков,
+        а меняет область счётчика через версию автора"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        url = reverse('posts:follow_index')
+        response = self.authorized_follower.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+        with mock.patch('posts.signals.follower_feeds') as follower_feeds:
+            Post.objects.create(text='Новый', author=self.author)
+        follower_feeds.assert_not_called()
+        response = self.authorized_follower.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 2)
+
+    @override_settings(FEED_FANOUT_LIMIT=1, FEED_FANOUT_RESUME=0)
+    def test_unfollow_keeps_celebrity_until_resume(self):
+        """Отписка не раскладывает посты: это делает resume_feed_fanout,
+        когда подписчиков не больше FEED_FANOUT_RESUME"""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.author)
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.filter(user=reader).delete()
+        self.assertTrue(feed.is_celebrity(self.author.pk))
+        self.assertFalse(FeedEntry.objects.filter(user=self.follower))
+        self.assertEqual(self.feed_posts(), [self.old_post])
+
+        call_command('resume_feed_fanout', stdout=StringIO())
+        self.assertTrue(feed.is_celebrity(self.author.pk))
+        with self.settings(FEED_FANOUT_RESUME=1):
+            call_command('resume_feed_fanout', stdout=StringIO())
+        self.assertFalse(feed.is_celebrity(self.author.pk))
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.follower).count(), 1)
+        self.assertEqual(self.feed_posts(), [self.old_post])
+
+
+class PostDetailCommentsTest(TestCase):
+    COMMENTS_COUNT: int = 25
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Текст поста', author=author)
+        for i in range(cls.COMMENTS_COUNT):
+            Comment.objects.create(
+                text=f'Комментарий {i}',
+                author=User.objects.create_user(username=f'reader{i}'),
+                post=cls.post,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_comments_are_paginated_without_n_plus_one(self):
+        """Комментарии выводятся страницами за фиксированное число запросов"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        with self.assertNumQueries(2):
+            response = self.guest_client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), settings.COUNT_COMMENTS)
+        self.assertEqual(comments.paginator.count, self.COMMENTS_COUNT)
+
+        response = self.guest_client.get(url, {'page': 2})
+        self.assertEqual(
+            len(response.context['comments']),
+            self.COMMENTS_COUNT - settings.COUNT_COMMENTS)
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='slug_slug',
+            description='Тестовое описание',
+        )
+        cls.cats = Post.objects.create(
+            text='Котики спят на солнце', author=cls.author, group=cls.group)
+        cls.dogs = Post.objects.create(
+            text='Собаки и кот гуляют', author=cls.other)
+        Post.objects.create(text='Про погоду', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def found(self, **params):
+        response = self.client.get(reverse('posts:search'), params)
+        return set(response.context['page_obj'])
+
+    def test_search_matches_word_prefixes(self):
+        """Поиск находит посты по началу слов без учёта регистра"""
+        self.assertEqual(self.found(q='КОТ'), {self.cats, self.dogs})
+        self.assertEqual(self.found(q='кот солнце'), {self.cats})
+        self.assertEqual(self.found(q='"; DROP'), set())
+
+    def test_search_filters(self):
+        """Результаты можно ограничить группой и автором"""
+        self.assertEqual(
+            self.found(q='кот', group=self.group.slug), {self.cats})
+        self.assertEqual(self.found(q='кот', author='other'), {self.dogs})
+
+    def test_index_follows_post_changes(self):
+        """Правка и удаление поста сразу видны в поиске"""
+        dogs = Post.objects.get(pk=self.dogs.pk)
+        dogs.text = 'Собаки гуляют'
+        dogs.save()
+        self.assertEqual(self.found(q='кот'), {self.cats})
+        Post.objects.get(pk=self.cats.pk).delete()
+        self.assertEqual(self.found(q='кот'), set())
+
+    @override_settings(COUNT_POST=1)
+    def test_pages_keep_query(self):
+        """Результаты листаются курсором без COUNT, ссылки хранят запрос"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:search'), {'q': 'кот'})
+        self.assertContains(
+            response, 'href="?q=%D0%BA%D0%BE%D1%82&amp;cursor=')
+        self.assertFalse(any('COUNT(' in query['sql']
+                             for query in queries.captured_queries))
+        cursor = response.context['page_obj'].next_cursor
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'кот', 'cursor': cursor})
+        self.assertEqual(list(response.context['page_obj']), [self.cats])
+
+    def test_rebuild_search_index(self):
+        """Команда перестраивает индекс по текущим постам"""
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM posts_post_fts')
+        self.assertEqual(self.found(q='кот'), set())
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.found(q='кот'), {self.cats, self.dogs})
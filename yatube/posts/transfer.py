@@ -0,0 +1,156 @@
+"""Потоковый импорт и экспорт данных posts в JSON Lines и CSV.
+
+Экспорт читает таблицу итератором по `chunk_size` строк, импорт пишет
+её `bulk_create` пачками по `batch_size`, так что память не зависит от
+размера файла. Ссылки на пользователей, группы и посты - их `id`:
+пользователи должны быть в базе до импорта.
+"""
+import csv
+import json
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from . import caching, counters, feed, search, stats
+from .models import Comment, Follow, Group, Post
+
+MODELS = {
+    'group': Group,
+    'post': Post,
+    'comment': Comment,
+    'follow': Follow,
+}
+FIELDS = {
+    'group': ('id', 'title', 'slug', 'description'),
+    'post': ('id', 'text', 'pub_date', 'author_id', 'group_id', 'image'),
+    'comment': ('id', 'text', 'created', 'author_id', 'post_id'),
+    'follow': ('id', 'user_id', 'author_id'),
+}
+
+
+def plain(value):
+    """Дата - в ISO 8601 целиком, с микросекундами: `DjangoJSONEncoder`
+    обрезает их до миллисекунд, и даты после импорта бы не совпали."""
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class JsonLines:
+    extension = 'jsonl'
+
+    def write(self, stream, fields, rows):
+        for row in rows:
+            stream.write(json.dumps(
+                row, default=plain, ensure_ascii=False) + '\n')
+
+    def read(self, stream, fields):
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Csv:
+    extension = 'csv'
+
+    def write(self, stream, fields, rows):
+        writer = csv.DictWriter(stream, fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: plain(value) for key, value in row.items()})
+
+    def read(self, stream, fields):
+        for row in csv.DictReader(stream):
+            # В CSV нет NULL: пустая ссылка - это её отсутствие
+            yield {
+                key: None if key.endswith('_id') and value == '' else value
+                for key, value in row.items()
+            }
+
+
+FORMATS = {
+    'jsonl': JsonLines(),
+    'csv': Csv(),
+}
+
+
+def guess_format(path):
+    """Формат по расширению файла, по умолчанию jsonl."""
+    for name, file_format in FORMATS.items():
+        if path.endswith('.' + file_format.extension):
+            return name
+    return 'jsonl'
+
+
+def export_rows(name, chunk_size):
+    fields = FIELDS[name]
+    rows = (
+        MODELS[name].objects.order_by('pk').values_list(*fields)
+        .iterator(chunk_size=chunk_size)
+    )
+    for row in rows:
+        yield dict(zip(fields, row))
+
+
+@contextmanager
+def explicit_dates(model):
+    """Отключает auto_now_add, чтобы импорт сохранил исходные даты."""
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def import_rows(name, rows, batch_size, skip=0, progress=None):
+    """Загружает строки пачками и возвращает число обработанных строк.
+
+    Каждая пачка - отдельная транзакция; после неё вызывается
+    `progress(done)`. Первые `skip` строк пропускаются - так импорт
+    продолжается с места сбоя. Уже существующие строки (по `id` и
+    уникальным ограничениям) пропускаются, поэтому повтор пачки безопасен.
+    """
+    model = MODELS[name]
+    fields = set(FIELDS[name])
+    done = skip
+    with explicit_dates(model):
+        rows = islice(rows, skip, None)
+        while True:
+            batch = [
+                model(**{key: value for key, value in row.items()
+                         if key in fields})
+                for row in islice(rows, batch_size)
+            ]
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+            done += len(batch)
+            if progress:
+                progress(done)
+    reset_sequences(model)
+    return done
+
+
+def reset_sequences(model):
+    """После вставки явных `id` сдвигает последовательность (PostgreSQL)."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def finish_import(*names):
+    """Досчитывает то, что при обычном сохранении делают сигналы."""
+    with transaction.atomic():
+        stats.rebuild()
+        if 'post' in names:
+            search.rebuild()
+        if {'post', 'follow'} & set(names):
+            feed.rebuild()
+    counters.forget([('all',)])
+    caching.bump([('users',), ('groups',)])
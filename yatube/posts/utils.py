@@ -1,8 +1,183 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+
+from django.core.paginator import Page, Paginator
 from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+
+from . import caching, counters, images
+from .models import Post
+
+
+def encode_cursor(direction, post):
+    """Упаковывает позицию `(pub_date, id)` в непрозрачный токен."""
+    raw = f'{direction}|{post.pub_date.isoformat()}|{post.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает `(direction, pub_date, id)` или None для битого токена."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in ('n', 'p') or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+class CursorPage(Page):
+    """Страница keyset-пагинации: вместо номеров - токены соседей."""
+
+    def __init__(self, object_list, cursor, paginator,
+                 has_next, has_previous):
+        super().__init__(object_list, cursor or 1, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return encode_cursor('n', self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return encode_cursor('p', self.object_list[0])
+
+
+class CursorPaginator(Paginator):
+    """Paginator по ключу `(pub_date, id)`, который никогда не считает
+    строки: стоимость любой страницы равна стоимости первой."""
+
+    is_cursor = True
+
+    def get_page(self, cursor):
+        position = decode_cursor(cursor) if cursor else None
+        if position is None:
+            return self._forward_page(None, Q())
+        direction, pub_date, pk = position
+        if direction == 'n':
+            after = Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+            return self._forward_page(cursor, after)
+        before = Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+        return self._backward_page(cursor, before)
+
+    def _forward_page(self, cursor, condition):
+        rows = list(
+            self.object_list.filter(condition)
+            .order_by('-pub_date', '-pk')[:self.per_page + 1]
+        )
+        return CursorPage(
+            rows[:self.per_page], cursor, self,
+            has_next=len(rows) > self.per_page,
+            has_previous=cursor is not None,
+        )
+
+    def _backward_page(self, cursor, condition):
+        rows = list(
+            self.object_list.filter(condition)
+            .order_by('pub_date', 'pk')[:self.per_page + 1]
+        )
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return CursorPage(
+            rows, cursor, self,
+            has_next=True,
+            has_previous=has_previous,
+        )
+
+
+class CountedPaginator(Paginator):
+    """Paginator с заранее известным (приблизительным) числом объектов.
+
+    Счётчик влияет только на навигацию: срез страницы берётся без оглядки
+    на него, поэтому неточный счётчик не теряет посты на странице."""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator для больших таблиц: без фильтров берёт оценку числа
+    строк из статистики базы вместо COUNT(*) по всей таблице.
+
+    Оценка используется только если она больше
+    `settings.EXACT_COUNT_LIMIT` - маленькие таблицы считаются точно."""
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimate_rows(self.object_list.model)
+            if estimate is not None and estimate > settings.EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+def estimate_rows(model):
+    """Примерное число строк таблицы модели, без её полного чтения."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass', [model._meta.db_table])
+        else:
+            # Разброс первичных ключей: читается с краёв индекса
+            table = connection.ops.quote_name(model._meta.db_table)
+            pk = connection.ops.quote_name(model._meta.pk.column)
+            cursor.execute(
+                f'SELECT MAX({pk}) - MIN({pk}) + 1 FROM {table}')
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+def paginator(request, post, cursor=None, scope=None, count=None,
+              per_page=None):
+    page = _get_page(request, post, cursor, scope, count, per_page)
+    if post.model is Post:
+        page.object_list = list(page.object_list)
+        images.attach_variants(page.object_list)
+        caching.attach_cards(
+            page.object_list, caching.cards_version(request))
+    return page
 
 
-def paginator(request, post):
-    paginator = Paginator(post, settings.COUNT_POST)
+def _get_page(request, post, cursor, scope, count, per_page):
+    per_page = per_page or settings.COUNT_POST
+    if cursor is None:
+        cursor = settings.CURSOR_PAGINATION
+    if cursor:
+        return CursorPaginator(post, per_page).get_page(
+            request.GET.get('cursor'))
+    if count is None and scope is not None:
+        count = counters.get_count(scope, post)
+    if count is not None:
+        paginator = CountedPaginator(post, per_page, count)
+        return paginator.get_page(request.GET.get('page'))
+    paginator = Paginator(post, per_page)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
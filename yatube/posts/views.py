@@ -1,40 +1,58 @@
-from .models import Post, Group
+from django.conf import settings
+from django.db.models import Q
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from .models import Post, User, Group, Follow
-from .forms import PostForm, CommentForm
+from .models import Post, User, Group, Follow, UserStats
+from .forms import PostForm, CommentForm, SearchForm
+from .caching import cache_anonymous_page, cards_version, depends
+from .feed import count_scope, feed, followed_celebrities
+from .search import search_posts
 from .utils import paginator
 
 
+@cache_anonymous_page
 def index(requests):
     template = 'posts/index.html'
+    posts_version = depends(requests, ('posts',), ('users',))
     post = Post.objects.select_related('author', 'group')
-    page_obj = paginator(request=requests, post=post)
+    page_obj = paginator(request=requests, post=post, scope=('all',))
     context = {
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'posts_version': posts_version,
+        'cards_version': cards_version(requests),
     }
     return render(requests, template, context)
 
 
+@cache_anonymous_page
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('group')
-    page_obj = paginator(request=request, post=posts)
+    depends(request, ('group', group.pk), ('users',))
+    posts = group.posts.select_related('author', 'group')
+    page_obj = paginator(request=request, post=posts,
+                         count=group.posts_count)
     context = {
         'group': group,
         'page_obj': page_obj,
+        'cards_version': cards_version(request),
     }
     return render(request, template, context)
 
 
+@cache_anonymous_page
 def profile(request, username):
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    depends(request, ('author', author.pk), ('users',))
+    stats = getattr(author, 'stats', None) or UserStats(user=author)
     post = author.posts.select_related('group')
-    page_obj = paginator(request=request, post=post)
-    posts_count = post.count()
-    first_post = post.first()
+    page_obj = paginator(request=request, post=post,
+                         count=stats.posts_count)
+    posts_count = stats.posts_count
+    first_post = page_obj[0] if page_obj else None
     following = (request.user.is_authenticated
                  and author.following.filter(user=request.user).exists())
     context = {
@@ -42,17 +60,30 @@ def profile(request, username):
         'page_obj': page_obj,
         'first_post': first_post,
         'posts_count': posts_count,
+        'stats': stats,
         'following': following,
+        'cards_version': cards_version(request),
     }
     return render(request, template, context)
 
 
+@cache_anonymous_page
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
     comment_form = CommentForm(request.POST or None)
-    post = get_object_or_404(Post, pk=post_id)
-    count = post.author.posts.count()
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id)
+    depends(request, ('post', post.pk), ('author', post.author_id),
+            ('group', post.group_id), ('users',))
+    stats = getattr(post.author, 'stats', None) or UserStats()
+    count = stats.posts_count
+    comments = paginator(
+        request=request,
+        post=post.comments.select_related('author'),
+        cursor=False,
+        count=post.comments_count,
+        per_page=settings.COUNT_COMMENTS,
+    )
     context = {
         'count': count,
         'post': post,
@@ -62,6 +93,51 @@ def post_detail(request, post_id):
     return render(request, template, context)
 
 
+@cache_anonymous_page
+def search(request):
+    template = 'posts/search.html'
+    depends(request, ('posts',), ('users',))
+    form = SearchForm(request.GET or None)
+    page_obj = None
+    if form.is_valid():
+        posts = Post.objects.select_related('author', 'group')
+        if form.cleaned_data['group']:
+            posts = posts.filter(group=form.cleaned_data['group'])
+        if form.cleaned_data['author']:
+            posts = posts.filter(
+                author__username=form.cleaned_data['author'])
+        posts = search_posts(posts, form.cleaned_data['q'])
+        # Точное число совпадений для частых слов - это COUNT(*) по
+        # всем найденным постам, поэтому результаты листаются курсором
+        page_obj = paginator(request=request, post=posts, cursor=True)
+    query = request.GET.copy()
+    query.pop('page', None)
+    query.pop('cursor', None)
+    context = {
+        'form': form,
+        'page_obj': page_obj,
+        'page_query': query.urlencode() + '&' if query else '',
+        'cards_version': cards_version(request),
+    }
+    return render(request, template, context)
+
+
+def group_autocomplete(request):
+    term = request.GET.get('term', '')
+    # SQLite сравнивает без учёта регистра только латиницу, поэтому
+    # отдельно ищем вариант с заглавной буквы: «друг» -> «Другая группа»
+    groups = (
+        Group.objects.filter(
+            Q(title__istartswith=term)
+            | Q(title__istartswith=term[:1].upper() + term[1:]))
+        .order_by('title').values('id', 'title')
+        [:settings.GROUP_AUTOCOMPLETE_LIMIT]
+    )
+    return JsonResponse({'results': [
+        {'id': group['id'], 'text': group['title']} for group in groups
+    ]})
+
+
 @login_required
 def post_create(request):
     template = 'posts/create.html'
@@ -119,11 +195,13 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     template = 'posts/follow.html'
-    posts = Post.objects.select_related(
-        'author', 'group').filter(author__following__user=request.user)
-    page_obj = paginator(request=request, post=posts)
+    celebrities = followed_celebrities(request.user)
+    posts = feed(request.user, celebrities)
+    page_obj = paginator(request=request, post=posts,
+                         scope=count_scope(request.user, celebrities))
     context = {
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'cards_version': cards_version(request),
     }
     return render(request, template, context)
 
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -25,6 +27,108 @@ SECRET_KEY = '2vn@s!8aa9ckt3j+2#b=$h)525_#@nuu33)cw(n-3x@*o-_um6'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 COUNT_POST: int = 10
+COUNT_COMMENTS: int = 20
+# Keyset-пагинация по ?cursor= вместо ?page= (без COUNT(*))
+CURSOR_PAGINATION: bool = False
+# Сколько секунд живут закешированные счётчики постов для paginator
+POST_COUNTS_TIMEOUT: int = 60 * 60
+# Авторы с большим числом подписчиков не раскладываются по лентам,
+# их посты домешиваются в ленту при чтении
+FEED_FANOUT_LIMIT: int = 10000
+# Знаменитость снова раскладывается по лентам (команда
+# resume_feed_fanout), только когда подписчиков не больше этого числа,
+# чтобы автор у самого предела не переключался туда и обратно
+FEED_FANOUT_RESUME: int = 9000
+# Сколько последних постов автора попадает в ленту при подписке
+FEED_BACKFILL: int = 1000
+# Страницы для анонимов живут до смены версий, таймаут - страховка
+PAGE_CACHE_TIMEOUT: int = 60 * 60 * 24
+# Защита от одновременного пересчёта (core.stampede): сколько секунд
+# отдавать устаревшее значение после срока, сколько держать блокировку
+# и насколько агрессивно обновлять значение до истечения срока
+CACHE_STALE_GRACE: int = 60
+CACHE_LOCK_TIMEOUT: int = 10
+CACHE_EARLY_EXPIRATION_BETA: float = 1.0
+# Сколько секунд живёт закешированная карточка поста ({% post_card %})
+POST_CARD_TIMEOUT: int = 60 * 60 * 24
+# Потоки, готовящие варианты загруженных картинок в фоне;
+# 0 - обрабатывать сразу после коммита в том же потоке
+IMAGE_WORKERS: int = 2
+# Варианты картинки поста, которые готовятся заранее:
+# имя -> (геометрия sorl-thumbnail, параметры)
+POST_IMAGE_VARIANTS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# Дополнительные ширины каждого варианта для srcset (пропорции те же)
+POST_IMAGE_WIDTHS = (480, 1440)
+# Современные форматы, которые готовятся рядом с основным, если их
+# поддерживают Pillow и sorl-thumbnail; браузер выбирает через <picture>
+POST_IMAGE_FORMATS = ('WEBP', 'AVIF')
+# Загруженный оригинал картинки поста уменьшается до этого размера
+# по длинной стороне и пересохраняется с этим качеством JPEG
+POST_IMAGE_MAX_SIDE: int = 2560
+POST_IMAGE_QUALITY: int = 85
+# Ограничения core.upload_handlers: размер файла в байтах и число
+# пикселей картинки, проверяются ещё во время приёма запроса
+UPLOAD_MAX_SIZE: int = 10 * 1024 * 1024
+UPLOAD_MAX_PIXELS: int = 50_000_000
+FILE_UPLOAD_HANDLERS = [
+    'core.upload_handlers.LimitedUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Сколько секунд кеш помнит готовые варианты картинок поста
+IMAGE_VARIANTS_TIMEOUT: int = 60 * 60 * 24
+# До скольких строк EstimatedCountPaginator (админка) считает точно
+EXACT_COUNT_LIMIT: int = 10000
+# Сколько групп форма поста показывает списком; при большем числе
+# группа выбирается автодополнением, по GROUP_AUTOCOMPLETE_LIMIT за раз
+GROUP_CHOICES_LIMIT: int = 100
+GROUP_AUTOCOMPLETE_LIMIT: int = 20
+# Конфигурация текстового поиска PostgreSQL (posts.search)
+POST_SEARCH_CONFIG = 'russian'
+# Заголовки X-DB-Query-Count и X-DB-Time-Ms в ответах (core.middleware);
+# их читает manage.py benchmark
+QUERY_STATS_HEADERS: bool = DEBUG
+# Время рендеринга каждого шаблона в заголовке Server-Timing
+# (core.templating); в метрики оно попадает всегда
+TEMPLATE_TIMING: bool = DEBUG
+# Выборочное профилирование (core.profiling): доля случайных запросов
+# и заголовок, по которому профилируется запрос с подписью из
+# core.profiling.make_token(); 0 и '' выключают middleware целиком
+PROFILING_SAMPLE_RATE: float = 0.0
+PROFILING_HEADER = ''
+PROFILING_TOKEN_MAX_AGE: int = 60 * 60
+# Как часто снимать стек, в секундах, и куда писать collapsed stacks
+PROFILING_INTERVAL: float = 0.001
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+# Каталог, куда воркеры пишут снимки метрик (core.metrics), чтобы
+# /metrics складывал их по всем процессам; '' - только свой процесс.
+# Снимок пишется не чаще раза в METRICS_FLUSH_INTERVAL секунд.
+# Тесты (manage.py test и pytest) снимков не пишут
+TESTING: bool = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+METRICS_DIR = '' if TESTING else os.environ.get(
+    'YATUBE_METRICS_DIR',
+    os.path.join(tempfile.gettempdir(), 'yatube-metrics'))
+METRICS_FLUSH_INTERVAL: float = 5.0
+# Bearer-токен для /metrics; без него эндпоинт открыт только при DEBUG
+# и только с INTERNAL_IPS
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN', '')
+# Сколько SQL-запросов может выполнить представление (tests/test_query_budget)
+QUERY_BUDGETS = {
+    'posts:index': 4,
+    'posts:group_list': 4,
+    'posts:profile': 5,
+    'posts:post_detail': 4,
+    'posts:post_create': 14,
+    'posts:post_edit': 6,
+    'posts:add_comment': 7,
+    'posts:follow_index': 5,
+    'posts:profile_follow': 4,
+    'posts:profile_unfollow': 9,
+    'posts:search': 6,
+    'posts:group_autocomplete': 3,
+}
 
 ALLOWED_HOSTS = [
     'localhost',
@@ -54,6 +158,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.ProfilingMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.QueryStatsMiddleware',
+    'core.templating.TemplateTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,12 +174,23 @@ MIDDLEWARE = [
 ROOT_URLCONF = 'yatube.urls'
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Без DEBUG шаблоны компилируются один раз на процесс (cached.Loader),
+# а wsgi.py компилирует их все при старте воркера
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if not DEBUG:
+    TEMPLATE_LOADERS = [
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    ]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -83,12 +202,53 @@ TEMPLATES = [
     },
 ]
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+# Общий для всех воркеров кеш выбирается переменной окружения
+# YATUBE_CACHE: locmem (по умолчанию, один процесс), filebased, db
+# (нужен `manage.py createcachetable`) или redis (нужен django-redis).
+# Для общих кешей перед ними ставится локальный L1 каждого процесса.
+CACHE_BACKEND = os.environ.get('YATUBE_CACHE', 'locmem')
+SHARED_CACHES = {
+    'filebased': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION', os.path.join(BASE_DIR, 'django_cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ.get('YATUBE_CACHE_LOCATION', 'yatube_cache'),
+    },
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
 }
 
+if CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.TwoTierCache',
+            'OPTIONS': {
+                'L1': 'local',
+                'L2': 'shared',
+                'L1_TIMEOUT': 5,
+                'L2_ONLY_PREFIXES': ['posts:version:', 'posts:count:'],
+                'PERSISTENT_PREFIXES': ['posts:version:'],
+            },
+        },
+        'local': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'l1',
+        },
+        'shared': SHARED_CACHES[CACHE_BACKEND],
+    }
+
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# Импорт только после настройки Django в get_wsgi_application()
+from core.templating import precompile  # noqa: E402
+
+precompile()